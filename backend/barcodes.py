@@ -0,0 +1,87 @@
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from models import Line
+
+BARCODE_INDEX_TTL_SECONDS = int(os.getenv("BARCODE_INDEX_TTL_SECONDS", 8 * 3600))
+BARCODE_INDEX_MAX_SESSIONS = int(os.getenv("BARCODE_INDEX_MAX_SESSIONS", 2000))
+
+# Match priority when one code appears in several fields or lines.
+BARCODE_FIELDS = ("ean", "gtin", "upc", "sku")
+GS1_FIELDS = ("ean", "gtin", "upc")
+GS1_LENGTHS = (8, 12, 13, 14)
+
+
+def normalize_gtin(code: str) -> Optional[str]:
+    """Return the zero-padded GTIN-14 form of an EAN-8, UPC-A, EAN-13 or GTIN-14 code."""
+    code = code.strip()
+    if code.isdigit() and len(code) in GS1_LENGTHS:
+        return code.zfill(14)
+    return None
+
+
+class BarcodeIndex:
+    """Maps every barcode of a session's lines to ``(line_id, matched_field)``.
+
+    Exact values win over GS1-normalised ones, so a code printed the same way
+    as in WooCommerce always resolves like it did before normalisation.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._gtin = {}
+
+    def add(self, line_id, field: str, value: Optional[str]):
+        value = (value or "").strip()
+        if not value:
+            return
+        self._exact.setdefault(value, (line_id, field))
+        if field in GS1_FIELDS:
+            gtin = normalize_gtin(value)
+            if gtin:
+                self._gtin.setdefault(gtin, (line_id, field))
+
+    @classmethod
+    def from_lines(cls, lines) -> "BarcodeIndex":
+        index = cls()
+        for field in BARCODE_FIELDS:
+            for line in lines:
+                index.add(line.id, field, getattr(line, field))
+        return index
+
+    def match(self, code: str) -> Optional[Tuple]:
+        code = code.strip()
+        if not code:
+            return None
+        match = self._exact.get(code)
+        if match is None:
+            gtin = normalize_gtin(code)
+            if gtin:
+                match = self._gtin.get(gtin)
+        return match
+
+
+session_indexes = TTLCache(maxsize=BARCODE_INDEX_MAX_SESSIONS, ttl_seconds=BARCODE_INDEX_TTL_SECONDS)
+
+
+def remember_session_lines(session_id, lines):
+    session_indexes.set(str(session_id), BarcodeIndex.from_lines(lines))
+
+
+def forget_session(session_id):
+    session_indexes.delete(str(session_id))
+
+
+def get_session_index(db: Session, session_id) -> BarcodeIndex:
+    """Return the session's barcode index, rebuilding it with one query after a restart or eviction."""
+    index = session_indexes.get(str(session_id))
+    if index is None:
+        lines = db.query(Line.id, Line.ean, Line.gtin, Line.upc, Line.sku).filter(
+            Line.session_id == session_id
+        ).all()
+        index = BarcodeIndex.from_lines(lines)
+        session_indexes.set(str(session_id), index)
+    return index
@@ -0,0 +1,156 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl_seconds`` after being set."""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 300):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_locked(self, key, now, default):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value, now):
+        self._data[key] = (value, now + self.ttl_seconds)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get_locked(key, time.monotonic(), default)
+
+    def get_many(self, keys) -> dict:
+        """Return the cached values for ``keys``, leaving misses out of the result."""
+        missing = object()
+        hits = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._get_locked(key, now, missing)
+                if value is not missing:
+                    hits[key] = value
+        return hits
+
+    def set(self, key, value):
+        with self._lock:
+            self._set_locked(key, value, time.monotonic())
+
+    def set_many(self, mapping: dict):
+        with self._lock:
+            now = time.monotonic()
+            for key, value in mapping.items():
+                self._set_locked(key, value, now)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalSharedCache:
+    """Awaitable ``TTLCache`` for ``shared_cache``, with the same methods as ``RedisCache``."""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    async def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    async def get_many(self, keys) -> dict:
+        return self._cache.get_many(keys)
+
+    async def set(self, key, value):
+        self._cache.set(key, value)
+
+    async def set_many(self, mapping: dict):
+        self._cache.set_many(mapping)
+
+    async def delete(self, key):
+        self._cache.delete(key)
+
+    async def clear(self):
+        self._cache.clear()
+
+
+class RedisCache:
+    """Cache kept in Redis, so every worker process sees the same entries.
+
+    It uses the asyncio client, so a lookup waits on Redis without blocking
+    the event loop. Values are pickled and expire after ``ttl_seconds``;
+    Redis' own eviction policy takes the place of ``maxsize``.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float = 300, url: str = CACHE_URL):
+        import redis.asyncio
+
+        self.ttl_seconds = ttl_seconds
+        self.prefix = f"picking:{namespace}:"
+        self._client = redis.asyncio.Redis.from_url(url)
+
+    def _key(self, key) -> str:
+        return self.prefix + repr(key)
+
+    async def get(self, key, default=None):
+        raw = await self._client.get(self._key(key))
+        return default if raw is None else pickle.loads(raw)
+
+    async def get_many(self, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        raws = await self._client.mget([self._key(key) for key in keys])
+        return {key: pickle.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    async def set(self, key, value):
+        await self._client.set(self._key(key), pickle.dumps(value), px=int(self.ttl_seconds * 1000))
+
+    async def set_many(self, mapping: dict):
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(self._key(key), pickle.dumps(value), px=int(self.ttl_seconds * 1000))
+        await pipeline.execute()
+
+    async def delete(self, key):
+        await self._client.delete(self._key(key))
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=self.prefix + "*"):
+            await self._client.delete(key)
+
+
+def shared_cache(namespace: str, maxsize: int = 1024, ttl_seconds: float = 300):
+    """Cache for entries every worker must agree on, e.g. invalidations and replayable responses.
+
+    Its methods are coroutines. With ``CACHE_BACKEND=redis`` it lives in the
+    Redis at ``CACHE_URL``; otherwise it is a process-local
+    ``LocalSharedCache``, which is only correct with a single worker.
+    """
+    if CACHE_BACKEND == "redis":
+        return RedisCache(namespace, ttl_seconds)
+    return LocalSharedCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
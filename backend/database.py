@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -6,16 +8,159 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+SQLITE_DATABASE_URL = "sqlite:///./picking.db"
+# Without DATABASE_URL the app runs on the local SQLite file, like the standalone image.
+DATABASE_URL = os.getenv("DATABASE_URL") or SQLITE_DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+pool_counters = {
+    "sync": {"checkouts": 0, "connects": 0, "invalidated": 0},
+    "async": {"checkouts": 0, "connects": 0, "invalidated": 0}
+}
+
+
+def _count_pool_events(engine, counters: dict):
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        counters["invalidated"] += 1
+
+
+def async_url(url: str) -> str:
+    """The same database behind an asyncio driver (asyncpg or aiosqlite)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    scheme, rest = url.split("://", 1)
+    if scheme in ("postgresql", "postgres", "postgresql+psycopg2"):
+        return "postgresql+asyncpg://" + rest
+    return url
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}, "pool_pre_ping": DB_POOL_PRE_PING}
+
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith("postgresql+asyncpg"):
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    elif DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args
+    }
+
+
+def make_engine(url: str):
+    """Build an engine with the pool settings from the environment.
+
+    Pre-ping replaces connections that died while idle (e.g. after a
+    database restart) and ``pool_recycle`` retires them before server-side
+    idle timeouts do. On PostgreSQL every connection also gets
+    ``statement_timeout`` so a runaway query cannot hold a pooled
+    connection forever.
+    """
+    engine = create_engine(url, **_engine_options(url))
+    _count_pool_events(engine, pool_counters["sync"])
+    return engine
+
+
+def make_async_engine(url: str):
+    """Like ``make_engine`` but for ``AsyncSession``; ``url`` may use the sync driver name."""
+    url = async_url(url)
+    engine = create_async_engine(url, **_engine_options(url))
+    _count_pool_events(engine.sync_engine, pool_counters["async"])
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = make_async_engine(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+
+# Keyset-paged timestamp columns. Cursors bind them with microseconds, so
+# SQLite rows stored by CURRENT_TIMESTAMP ("YYYY-MM-DD HH:MM:SS") would sort
+# below their own cursor and come back on every page.
+KEYSET_TIMESTAMP_COLUMNS = (("sessions", "started_at"), ("photos", "created_at"), ("events", "created_at"))
+
+
+def _pad_sqlite_timestamps(engine):
+    """Give SQLite timestamps written without a fraction the ".ffffff" the cursors compare against."""
+    with engine.begin() as connection:
+        for table, column in KEYSET_TIMESTAMP_COLUMNS:
+            connection.execute(text(f"UPDATE {table} SET {column} = {column} || '.000000' WHERE length({column}) = 19"))
+
+
+def use_sqlite_database(url: str = SQLITE_DATABASE_URL):
+    """Point the shared engines and session factories at a local SQLite file, creating its tables."""
+    global engine, async_engine
+    engine.dispose()
+    engine = make_engine(url)
+    try:
+        Base.metadata.create_all(bind=engine)
+    except OperationalError:
+        # Another worker created the same tables in between; the retry only checks them.
+        Base.metadata.create_all(bind=engine)
+    _pad_sqlite_timestamps(engine)
+    SessionLocal.configure(bind=engine)
+    async_engine = make_async_engine(url)
+    AsyncSessionLocal.configure(bind=async_engine)
+    return engine
+
+
+def _pool_status(pool) -> dict:
+    status = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow()
+        )
+    return status
+
+
+def pool_stats() -> dict:
+    return {
+        "sync": dict(pool_counters["sync"], **_pool_status(engine.pool)),
+        "async": dict(pool_counters["async"], **_pool_status(async_engine.pool))
+    }
+
+
+async def dispose_engines():
+    engine.dispose()
+    await async_engine.dispose()
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
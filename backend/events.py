@@ -0,0 +1,136 @@
+import asyncio
+import os
+import uuid
+from datetime import date, datetime
+from typing import Callable, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from models import Event
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", 200))
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_FLUSH_INTERVAL_SECONDS", 1.0))
+EVENT_MAX_PENDING = int(os.getenv("EVENT_MAX_PENDING", 10000))
+
+# Payload keys copied into their own indexed columns for the event history search.
+INDEXED_PAYLOAD_KEYS = ("code", "result", "matched_field")
+
+
+def _column_value(key: str, value):
+    # Scanned codes have no length limit (e.g. QR labels); the payload keeps
+    # the full value and the indexed column a prefix that fits.
+    length = Event.__table__.c[key].type.length
+    return value[:length] if isinstance(value, str) and length else value
+
+
+def indexed_fields(payload: Optional[dict]) -> dict:
+    payload = payload or {}
+    return {key: _column_value(key, payload.get(key)) for key in INDEXED_PAYLOAD_KEYS}
+
+
+class EventWriter:
+    """Writes audit events either inside the caller's transaction or through a buffer.
+
+    ``write`` adds the event to the caller's session, so it commits (or rolls
+    back) with the change it describes; use it when the event must be durable
+    or is needed by later reads, like scan idempotency keys. ``emit`` only
+    queues the row; queued rows are written with one bulk INSERT when
+    ``EVENT_BUFFER_SIZE`` rows are waiting or every
+    ``EVENT_FLUSH_INTERVAL_SECONDS``, and whatever is left on shutdown.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE,
+                 flush_interval: float = EVENT_FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = EVENT_MAX_PENDING):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._session_factory: Optional[Callable] = None
+        self._buffer = []
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+    def write(self, db: Session, session_id, user_id, type: str, payload: Optional[dict] = None,
+              idempotency_key: Optional[str] = None) -> Event:
+        event = Event(
+            session_id=session_id,
+            user_id=user_id,
+            type=type,
+            payload=payload,
+            idempotency_key=idempotency_key,
+            **indexed_fields(payload)
+        )
+        db.add(event)
+        return event
+
+    def emit(self, session_id, user_id, type: str, payload: Optional[dict] = None):
+        self._buffer.append({
+            "id": uuid.uuid4(),
+            "session_id": uuid.UUID(str(session_id)),
+            "user_id": user_id,
+            "type": type,
+            "payload": payload,
+            **indexed_fields(payload),
+            "created_at": datetime.utcnow()
+        })
+        if len(self._buffer) >= self.buffer_size and self._flushing is None:
+            self._flushing = asyncio.get_running_loop().create_task(self.flush())
+
+    def _insert(self, rows: list):
+        with self._session_factory() as db:
+            db.execute(insert(Event), rows)
+            db.commit()
+
+    async def flush(self):
+        try:
+            while self._buffer:
+                rows, self._buffer = self._buffer[:self.buffer_size], self._buffer[self.buffer_size:]
+                try:
+                    await asyncio.to_thread(self._insert, rows)
+                except BaseException as e:
+                    print(f"❌ Error writing {len(rows)} events: {e}")
+                    if len(self._buffer) + len(rows) <= self.max_pending:
+                        self._buffer[:0] = rows
+                    return
+        finally:
+            self._flushing = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._flushing is None:
+                await self.flush()
+
+    def start(self, session_factory: Callable):
+        self._session_factory = session_factory
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+
+
+def _month_start(day: date, months_ahead: int = 0) -> date:
+    month = day.month - 1 + months_ahead
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_event_partitions(db: Session, months_ahead: int = 2):
+    """Create the monthly ``events`` partitions for this month and the next ones (PostgreSQL only)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    # Workers starting together would otherwise race on the same CREATE TABLE.
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext('create_events_partition'))"))
+    today = date.today()
+    for offset in range(months_ahead + 1):
+        db.execute(text("SELECT create_events_partition(:month)"), {"month": _month_start(today, offset)})
+    db.commit()
+
+
+event_writer = EventWriter()
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+from models import SessionModel, Line, Event
+
+EXPORT_BATCH_SIZE = 1000
+
+# entity -> (model, exported columns, column the from/to range applies to)
+EXPORTS = {
+    "sessions": (
+        SessionModel,
+        ("id", "order_id", "user_id", "warehouse_id", "status", "started_at", "finished_at"),
+        SessionModel.started_at
+    ),
+    "lines": (
+        Line,
+        ("id", "session_id", "product_id", "sku", "ean", "gtin", "upc", "product_name",
+         "expected_qty", "picked_qty", "status", "created_at"),
+        Line.created_at
+    ),
+    "events": (
+        Event,
+        ("id", "session_id", "user_id", "type", "payload", "created_at"),
+        Event.created_at
+    ),
+}
+
+
+def build_export_query(entity: str, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                       warehouse_id: Optional[uuid.UUID] = None):
+    model, fields, date_column = EXPORTS[entity]
+    query = select(*(getattr(model, field) for field in fields))
+    if date_from is not None:
+        query = query.where(date_column >= date_from)
+    if date_to is not None:
+        query = query.where(date_column < date_to)
+    if warehouse_id is not None:
+        if model is not SessionModel:
+            query = query.join(SessionModel, SessionModel.id == model.session_id)
+        query = query.where(SessionModel.warehouse_id == warehouse_id)
+    return fields, query
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return _json_value(value)
+
+
+def stream_export(session_factory: Callable, entity: str, export_format: str, **filters):
+    """Yield the export as NDJSON or CSV chunks, one chunk per fetched batch.
+
+    Rows are read through a server-side cursor (``yield_per``) in storage
+    order, so memory stays flat and the first bytes go out right away.
+    """
+    fields, query = build_export_query(entity, **filters)
+    with session_factory() as db:
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            for rows in result.partitions():
+                writer.writerows([_csv_value(value) for value in row] for row in rows)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            for rows in result.partitions():
+                yield "".join(
+                    json.dumps({field: _json_value(value) for field, value in zip(fields, row)}) + "\n"
+                    for row in rows
+                ).encode()
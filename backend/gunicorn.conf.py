@@ -0,0 +1,21 @@
+import multiprocessing
+import os
+
+# One uvicorn event loop per worker process. Size DB_POOL_SIZE/DB_MAX_OVERFLOW
+# per worker: the database sees workers x (sync + async pool) connections.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# The user cache, idempotent replays and order invalidations are only shared
+# between workers through Redis (see cache.shared_cache); with the default
+# process-local cache a second worker would serve stale users and replay
+# nothing, so it runs a single worker.
+shared_cache_backend = os.getenv("CACHE_BACKEND", "local") == "redis"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() if shared_cache_backend else 1))
+if workers > 1 and not shared_cache_backend:
+    raise RuntimeError(f"WEB_CONCURRENCY={workers} requires CACHE_BACKEND=redis; the local cache is per process")
+
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+accesslog = "-"
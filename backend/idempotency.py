@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import os
+import re
+
+from cache import shared_cache
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+IDEMPOTENCY_HEADER = b"idempotency-key"
+IDEMPOTENT_PATHS = re.compile(r"^(/api)?/sessions/[^/]+/(scan|photo|finish|exception)$")
+
+
+class IdempotencyMiddleware:
+    """Replays the stored response when a picking POST is retried with the same ``Idempotency-Key``.
+
+    Keys are scoped to the caller's Authorization header, method and path.
+    Responses below 500 are kept for ``IDEMPOTENCY_TTL_SECONDS``; a retry that
+    arrives while the original is still running waits for it and gets the
+    same answer instead of running the handler twice. Stored responses live
+    in the shared cache so a retry routed to another worker is replayed too;
+    the wait for an in-flight original only spans one worker.
+    """
+
+    def __init__(self, app, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.app = app
+        self.responses = shared_cache("idempotency", maxsize=max_entries, ttl_seconds=ttl_seconds)
+        self._inflight = {}
+
+    def _cache_key(self, scope):
+        if scope["type"] != "http" or scope["method"] != "POST" or not IDEMPOTENT_PATHS.match(scope["path"]):
+            return None
+        headers = dict(scope["headers"])
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return None
+        caller = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()
+        return (caller, scope["path"], key.decode("latin-1"))
+
+    async def __call__(self, scope, receive, send):
+        cache_key = self._cache_key(scope)
+        if cache_key is None:
+            return await self.app(scope, receive, send)
+
+        while cache_key in self._inflight:
+            await self._inflight[cache_key].wait()
+
+        stored = await self.responses.get(cache_key)
+        if stored is not None:
+            return await self._replay(stored, send)
+
+        done = asyncio.Event()
+        self._inflight[cache_key] = done
+        captured = {"body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+            if captured.get("status", 500) < 500:
+                await self.responses.set(cache_key, (captured["status"], captured["headers"], b"".join(captured["body"])))
+        finally:
+            self._inflight.pop(cache_key, None)
+            done.set()
+
+    async def _replay(self, stored, send):
+        status, headers, body = stored
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [(b"idempotent-replayed", b"true")]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -40,14 +40,42 @@ CREATE TABLE photos (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Append-only log, partitioned by month so old months can be detached or dropped whole.
+-- Databases created before 'scan_complete' need the type check replaced:
+--   ALTER TABLE events DROP CONSTRAINT events_type_check;
+--   ALTER TABLE events ADD CONSTRAINT events_type_check CHECK (type IN ('scan', 'scan_invalid', 'scan_complete', 'photo', 'finish', 'error', 'exception_created', 'exception_approved', 'exception_rejected'));
 CREATE TABLE events (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     session_id UUID NOT NULL REFERENCES sessions(id),
     user_id UUID NOT NULL REFERENCES users(id),
-    type VARCHAR(50) NOT NULL CHECK (type IN ('scan', 'photo', 'finish', 'error', 'exception_created', 'exception_approved', 'exception_rejected')),
+    type VARCHAR(50) NOT NULL CHECK (type IN ('scan', 'scan_invalid', 'scan_complete', 'photo', 'finish', 'error', 'exception_created', 'exception_approved', 'exception_rejected')),
     payload JSONB,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    idempotency_key VARCHAR(255),
+    code VARCHAR(255),
+    result VARCHAR(20),
+    matched_field VARCHAR(20),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE events_default PARTITION OF events DEFAULT;
+
+-- Creates the partition for the month containing month_start; the backend calls it on startup.
+CREATE OR REPLACE FUNCTION create_events_partition(month_start DATE) RETURNS VOID AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+        'events_' || to_char(first_day, 'YYYY_MM'),
+        first_day,
+        (first_day + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_events_partition(CURRENT_DATE);
+SELECT create_events_partition((CURRENT_DATE + INTERVAL '1 month')::DATE);
 
 CREATE TABLE exceptions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -85,6 +113,29 @@ ALTER TABLE sessions ADD COLUMN warehouse_id UUID REFERENCES warehouses(id);
 
 CREATE INDEX idx_users_warehouse_id ON users(warehouse_id);
 CREATE INDEX idx_sessions_warehouse_id ON sessions(warehouse_id);
+CREATE INDEX idx_sessions_warehouse_status_finished ON sessions(warehouse_id, status, finished_at);
+CREATE INDEX idx_sessions_started_at_id ON sessions(started_at, id);
+
+ALTER TABLE lines ADD COLUMN sku VARCHAR(255);
+ALTER TABLE lines ADD COLUMN gtin VARCHAR(255);
+ALTER TABLE lines ADD COLUMN upc VARCHAR(255);
+ALTER TABLE lines ADD COLUMN product_name VARCHAR(500);
+ALTER TABLE lines ALTER COLUMN ean DROP NOT NULL;
+
+CREATE INDEX idx_lines_session_ean ON lines(session_id, ean);
+CREATE INDEX idx_lines_session_gtin ON lines(session_id, gtin);
+CREATE INDEX idx_lines_session_upc ON lines(session_id, upc);
+CREATE INDEX idx_lines_session_sku ON lines(session_id, sku);
+
+ALTER TABLE photos ADD COLUMN thumbnail_url VARCHAR(500);
+ALTER TABLE photos ADD COLUMN webp_url VARCHAR(500);
+
+CREATE INDEX idx_photos_created_at_id ON photos(created_at, id);
+
+CREATE INDEX idx_events_session_idempotency_key ON events(session_id, idempotency_key);
+CREATE INDEX idx_events_code_created_at ON events(code, created_at);
+CREATE INDEX idx_events_type_created_at ON events(type, created_at);
+CREATE INDEX idx_events_user_created_at ON events(user_id, created_at);
 
 INSERT INTO warehouses (id, name, code, address) VALUES 
 ('660e8400-e29b-41d4-a716-446655440000', 'Almacén Principal', 'MAIN', 'Dirección del almacén principal');
@@ -107,3 +158,54 @@ INSERT INTO system_config (config_key, config_value) VALUES
 ('camera_scanning', '"true"'),
 ('qr_labels', '"true"'),
 ('multi_warehouse', '"true"');
+
+CREATE TABLE picker_daily_metrics (
+    day DATE NOT NULL,
+    warehouse_id UUID NOT NULL,
+    user_id UUID NOT NULL REFERENCES users(id),
+    completed_sessions INTEGER NOT NULL DEFAULT 0,
+    duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    items_picked INTEGER NOT NULL DEFAULT 0,
+    incident_sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, warehouse_id, user_id)
+);
+
+CREATE TABLE product_daily_metrics (
+    day DATE NOT NULL,
+    warehouse_id UUID NOT NULL,
+    ean VARCHAR(255) NOT NULL,
+    product_name VARCHAR(500),
+    total_lines INTEGER NOT NULL DEFAULT 0,
+    error_lines INTEGER NOT NULL DEFAULT 0,
+    error_picked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, warehouse_id, ean)
+);
+
+CREATE TABLE woocommerce_outbox (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    session_id UUID NOT NULL REFERENCES sessions(id),
+    user_id UUID NOT NULL REFERENCES users(id),
+    order_id INTEGER NOT NULL,
+    order_status VARCHAR(50) NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    event_payload JSONB,
+    state VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'done', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+CREATE INDEX idx_woocommerce_outbox_state_next_attempt ON woocommerce_outbox(state, next_attempt_at);
+
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY,
+    number VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    data JSONB NOT NULL,
+    modified_at TIMESTAMP,
+    synced_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_orders_status_id ON orders(status, id);
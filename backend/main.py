@@ -1,60 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Response, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, update, case, tuple_, select
 from typing import List, Optional
 import uvicorn
-from datetime import datetime, timedelta
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-import boto3
-from botocore.exceptions import ClientError
 import os
+import uuid
+import json
+import base64
+from collections import defaultdict
 from dotenv import load_dotenv
-import requests
-from requests.auth import HTTPBasicAuth
 
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base
+from database import (
+    get_db, get_async_db, AsyncSessionLocal, use_sqlite_database, pool_stats, dispose_engines, DATABASE_URL
+)
+from models import User, SessionModel, Line, Photo, Event, Exception, Warehouse, SystemConfig, OutboxJob, Order
 
 if os.path.exists("/app/frontend/dist"):
-    SQLITE_DATABASE_URL = "sqlite:///./picking.db"
-    engine = create_engine(SQLITE_DATABASE_URL, connect_args={"check_same_thread": False})
-    Base.metadata.create_all(bind=engine)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    def get_db():
-        db = SessionLocal()
-        try:
-            yield db
-        finally:
-            db.close()
-else:
-    try:
-        from database import get_db, engine
-    except Exception:
-        SQLITE_DATABASE_URL = "sqlite:///./picking.db"
-        engine = create_engine(SQLITE_DATABASE_URL, connect_args={"check_same_thread": False})
-        Base.metadata.create_all(bind=engine)
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        
-        def get_db():
-            db = SessionLocal()
-            try:
-                yield db
-            finally:
-                db.close()
-from models import User, SessionModel, Line, Photo, Event, Exception, Warehouse, SystemConfig
+    use_sqlite_database()
+elif DATABASE_URL.startswith("sqlite"):
+    if not os.getenv("DATABASE_URL"):
+        print("⚠️ DATABASE_URL is not set, using the local SQLite database")
+    use_sqlite_database(DATABASE_URL)
+
 from schemas import (
     UserLogin, UserRegister, Token, UserResponse, OrderResponse, SessionResponse,
     ScanRequest, PhotoResponse, FinishSessionRequest, MetricsResponse,
-    PickerMetrics, ProductMetrics, CreateExceptionRequest, ExceptionResponse,
-    ApproveExceptionRequest, WarehouseResponse, WarehouseCreate, LineItem
+    CreateExceptionRequest, ExceptionResponse, ApproveExceptionRequest,
+    WarehouseResponse, WarehouseCreate, LineItem,
+    BatchScanRequest, BatchScanResult, BatchScanResponse,
+    PhotoPresignRequest, PhotoPresignResponse, PhotoConfirmRequest
+)
+from woocommerce import (
+    get_woocommerce_order, get_woocommerce_products, invalidate_woocommerce_order,
+    close_woocommerce_client
+)
+from cache import shared_cache
+from idempotency import IdempotencyMiddleware
+from metrics import compute_metrics, MetricsSnapshotCache
+from exports import EXPORTS, stream_export
+from rollups import record_session_finished
+from events import event_writer, ensure_event_partitions, indexed_fields
+from outbox import outbox_worker, enqueue_order_status
+from orders import order_reconciler, verify_webhook_signature, upsert_orders, delete_orders
+from photos import (
+    photo_pipeline, PhotoUploadError, object_url, object_key, signed_urls, photo_key, is_photo_key, presign_upload,
+    PHOTO_PRESIGN_EXPIRES_SECONDS, PHOTO_MAX_UPLOAD_MB
 )
+from barcodes import get_session_index, remember_session_lines, forget_session
+from passwords import get_password_hash, verify_and_update_password, password_hasher
 
 load_dotenv()
 
@@ -77,6 +78,8 @@ def detailed_health(db: Session = Depends(get_db)):
             "database": "ok",
             "admin_user_exists": admin_exists,
             "admin_user_role": admin_user.role if admin_user else None,
+            "password_hashing": password_hasher.stats(),
+            "database_pool": pool_stats(),
             "timestamp": "2025-08-25T05:18:00Z"
         }
     except Exception as e:
@@ -87,6 +90,8 @@ def detailed_health(db: Session = Depends(get_db)):
             "timestamp": "2025-08-25T05:18:00Z"
         }
 
+app.add_middleware(IdempotencyMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -96,33 +101,14 @@ app.add_middleware(
 )
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 10080))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
 
-MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT")
-MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
-MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
-MINIO_BUCKET_NAME = os.getenv("MINIO_BUCKET_NAME")
-
-WOOCOMMERCE_URL = os.getenv("WOOCOMMERCE_URL")
-WOOCOMMERCE_CONSUMER_KEY = os.getenv("WOOCOMMERCE_CONSUMER_KEY")
-WOOCOMMERCE_CONSUMER_SECRET = os.getenv("WOOCOMMERCE_CONSUMER_SECRET")
-
-s3_client = boto3.client(
-    's3',
-    endpoint_url=f'http://{MINIO_ENDPOINT}',
-    aws_access_key_id=MINIO_ACCESS_KEY,
-    aws_secret_access_key=MINIO_SECRET_KEY
-)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Detached User rows keyed by token subject; see get_current_user.
+user_cache = shared_cache("users", maxsize=1024, ttl_seconds=USER_CACHE_TTL_SECONDS)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -134,7 +120,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """The token's user, from ``user_cache`` when possible; a session is only opened on a miss."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -148,54 +135,22 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
+    user = await user_cache.get(username)
+    if user is not None:
+        return user
+    
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+        if user is None:
+            raise credentials_exception
+        # Detach so commits in this request cannot expire the cached copy.
+        db.expunge(user)
+    await user_cache.set(username, user)
     return user
 
-def get_woocommerce_orders():
-    try:
-        url = f"{WOOCOMMERCE_URL}/wp-json/wc/v3/orders"
-        auth = HTTPBasicAuth(WOOCOMMERCE_CONSUMER_KEY, WOOCOMMERCE_CONSUMER_SECRET)
-        params = {"status": "processing", "per_page": 100}
-        response = requests.get(url, auth=auth, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        return []
-
-def get_woocommerce_product_details(product_id: int):
-    try:
-        url = f"{WOOCOMMERCE_URL}/wp-json/wc/v3/products/{product_id}"
-        auth = HTTPBasicAuth(WOOCOMMERCE_CONSUMER_KEY, WOOCOMMERCE_CONSUMER_SECRET)
-        response = requests.get(url, auth=auth)
-        response.raise_for_status()
-        product = response.json()
-        
-        image_url = None
-        if product.get('images') and len(product['images']) > 0:
-            image_url = product['images'][0].get('src')
-        
-        return {
-            'id': product.get('id'),
-            'name': product.get('name'),
-            'sku': product.get('sku'),
-            'image_url': image_url
-        }
-    except Exception as e:
-        print(f"Error fetching WooCommerce product {product_id}: {e}")
-        return None
-
-def update_woocommerce_order_status(order_id: int, status: str):
-    try:
-        url = f"{WOOCOMMERCE_URL}/wp-json/wc/v3/orders/{order_id}"
-        auth = HTTPBasicAuth(WOOCOMMERCE_CONSUMER_KEY, WOOCOMMERCE_CONSUMER_SECRET)
-        data = {"status": status}
-        response = requests.put(url, auth=auth, json=data)
-        response.raise_for_status()
-        return True
-    except Exception as e:
-        return False
+async def invalidate_cached_user(*usernames):
+    for username in usernames:
+        await user_cache.delete(username)
 
 @app.on_event("startup")
 async def startup_event():
@@ -211,6 +166,26 @@ async def startup_event():
         print("⚠️ Admin initialization module not found")
     except BaseException as e:
         print(f"❌ Error during admin user initialization: {e}")
+    
+    try:
+        with contextmanager(get_db)() as db:
+            ensure_event_partitions(db)
+    except BaseException as e:
+        print(f"❌ Error creating event partitions: {e}")
+    event_writer.start(contextmanager(get_db))
+    photo_pipeline.start(contextmanager(get_db))
+    outbox_worker.start(contextmanager(get_db))
+    order_reconciler.start(contextmanager(get_db))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await outbox_worker.stop()
+    await order_reconciler.stop()
+    await event_writer.stop()
+    photo_pipeline.shutdown()
+    await dispose_engines()
+    await close_woocommerce_client()
+    password_hasher.shutdown()
 
 @app.post("/auth/login", response_model=Token)
 async def login(user_login: UserLogin, db: Session = Depends(get_db)):
@@ -227,7 +202,7 @@ async def login(user_login: UserLogin, db: Session = Depends(get_db)):
     
     print(f"✅ User found: {user.username}, role: {user.role}")
     
-    password_valid = verify_password(user_login.password, user.password_hash)
+    password_valid, new_password_hash = await verify_and_update_password(user_login.password, user.password_hash)
     print(f"🔑 Password verification: {'✅ Valid' if password_valid else '❌ Invalid'}")
     
     if not password_valid:
@@ -238,6 +213,11 @@ async def login(user_login: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if new_password_hash:
+        user.password_hash = new_password_hash
+        db.commit()
+        db.refresh(user)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -263,7 +243,7 @@ async def register(user_register: UserRegister, db: Session = Depends(get_db)):
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    hashed_password = get_password_hash(user_register.password)
+    hashed_password = await get_password_hash(user_register.password)
     new_user = User(
         username=user_register.username,
         password_hash=hashed_password,
@@ -288,22 +268,24 @@ async def start_picking_session(order_id: int, current_user: User = Depends(get_
     if existing_session:
         raise HTTPException(status_code=400, detail="Session already in progress for this order")
     
-    orders = get_woocommerce_orders()
-    order = next((o for o in orders if o["id"] == order_id), None)
-    if not order:
+    order = await get_woocommerce_order(order_id)
+    if not order or order.get("status") != "processing":
         raise HTTPException(status_code=404, detail="Order not found")
     
     session = SessionModel(
         order_id=order_id,
         user_id=current_user.id,
+        warehouse_id=current_user.warehouse_id,
         status="in_progress"
     )
     db.add(session)
     db.commit()
     db.refresh(session)
     
+    products = await get_woocommerce_products(item["product_id"] for item in order["line_items"])
+    lines = []
     for item in order["line_items"]:
-        product_details = get_woocommerce_product_details(item["product_id"])
+        product_details = products.get(item["product_id"])
         sku = item.get("sku") or ""
         ean = ""
         gtin = ""
@@ -311,9 +293,9 @@ async def start_picking_session(order_id: int, current_user: User = Depends(get_
         product_name = item.get("name") or ""
         
         if product_details:
-            ean = product_details.get("ean") or product_details.get("_ean") or product_details.get("_alg_ean") or ""
-            gtin = product_details.get("gtin") or product_details.get("_gtin") or ""
-            upc = product_details.get("upc") or product_details.get("_upc") or ""
+            ean = product_details.get("ean") or ""
+            gtin = product_details.get("gtin") or ""
+            upc = product_details.get("upc") or ""
             if not product_name:
                 product_name = product_details.get("name") or ""
         
@@ -330,285 +312,458 @@ async def start_picking_session(order_id: int, current_user: User = Depends(get_
             status="pending"
         )
         db.add(line)
+        lines.append(line)
     
+    db.flush()
+    remember_session_lines(session.id, lines)
     db.commit()
     
     return SessionResponse(
         id=session.id,
         order_id=session.order_id,
+        warehouse_id=session.warehouse_id,
         status=session.status,
         started_at=session.started_at
     )
 
+def apply_scan(db: Session, session: SessionModel, user: User, scanned_code: str,
+               idempotency_key: Optional[str] = None, client_timestamp: Optional[datetime] = None):
+    """Apply one scan to the session without committing and return its outcome."""
+    extra_payload = {"client_timestamp": client_timestamp.isoformat()} if client_timestamp else {}
+    match = get_session_index(db, session.id).match(scanned_code)
+    
+    if match:
+        line_id, matched_field = match
+        
+        # The guard makes concurrent scans of the same line serialize on the row
+        # lock instead of overwriting each other's picked_qty.
+        line = db.execute(
+            update(Line)
+            .where(Line.id == line_id, Line.picked_qty < Line.expected_qty)
+            .values(
+                picked_qty=Line.picked_qty + 1,
+                status=case((Line.picked_qty + 1 >= Line.expected_qty, "completed"), else_="in_progress")
+            )
+            .returning(
+                Line.picked_qty, Line.expected_qty, Line.ean, Line.gtin,
+                Line.upc, Line.sku, Line.product_name
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if line:
+            event_writer.write(
+                db, session.id, user.id, "scan",
+                idempotency_key=idempotency_key,
+                payload={
+                    "code": scanned_code,
+                    "matched_field": matched_field,
+                    "ean": line.ean,
+                    "gtin": line.gtin,
+                    "upc": line.upc,
+                    "sku": line.sku,
+                    "product_name": line.product_name,
+                    "picked_qty": line.picked_qty,
+                    "expected_qty": line.expected_qty,
+                    "result": "valid",
+                    **extra_payload
+                }
+            )
+            result = "valid"
+        else:
+            line = db.query(Line.picked_qty, Line.expected_qty, Line.product_name).filter(Line.id == line_id).first()
+            result = "complete"
+            if line:
+                # Recorded too, so a replay of this scan's idempotency key is a duplicate.
+                event_writer.write(
+                    db, session.id, user.id, "scan_complete",
+                    idempotency_key=idempotency_key,
+                    payload={
+                        "code": scanned_code,
+                        "matched_field": matched_field,
+                        "product_name": line.product_name,
+                        "picked_qty": line.picked_qty,
+                        "expected_qty": line.expected_qty,
+                        "result": "complete",
+                        **extra_payload
+                    }
+                )
+
+        if line:
+            return {
+                "result": result,
+                "matched_field": matched_field,
+                "picked_qty": line.picked_qty,
+                "expected_qty": line.expected_qty,
+                "product_name": line.product_name
+            }
+        forget_session(session.id)
+    
+    event_writer.write(
+        db, session.id, user.id, "scan_invalid",
+        idempotency_key=idempotency_key,
+        payload={
+            "code": scanned_code,
+            "result": "invalid",
+            "reason": "Product not found in this order",
+            **extra_payload
+        }
+    )
+    return {"result": "invalid"}
+
 @app.post("/sessions/{session_id}/scan")
 async def register_scan(
-    session_id: str,
+    session_id: uuid.UUID,
     scan_request: ScanRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    scanned_code = scan_request.code.strip()
-    
-    line = None
-    matched_field = None
-    
-    if scanned_code:
-        line = db.query(Line).filter(
-            Line.session_id == session_id,
-            Line.ean == scanned_code
-        ).first()
-        if line:
-            matched_field = "ean"
-    
-    if not line and scanned_code:
-        line = db.query(Line).filter(
-            Line.session_id == session_id,
-            Line.gtin == scanned_code
-        ).first()
-        if line:
-            matched_field = "gtin"
-    
-    if not line and scanned_code:
-        line = db.query(Line).filter(
-            Line.session_id == session_id,
-            Line.upc == scanned_code
-        ).first()
-        if line:
-            matched_field = "upc"
+    outcome = await db.run_sync(apply_scan, session, current_user, scan_request.code.strip())
+    await db.commit()
     
-    if not line and scanned_code:
-        line = db.query(Line).filter(
-            Line.session_id == session_id,
-            Line.sku == scanned_code
-        ).first()
-        if line:
-            matched_field = "sku"
-    
-    if not line:
-        scan_event = Event(
-            session_id=session_id,
-            user_id=current_user.id,
-            type="scan_invalid",
-            payload={
-                "code": scanned_code,
-                "result": "invalid",
-                "reason": "Product not found in this order"
-            }
-        )
-        db.add(scan_event)
-        db.commit()
+    if outcome["result"] == "invalid":
         raise HTTPException(status_code=404, detail="Product not found in this order")
     
-    if line.picked_qty < line.expected_qty:
-        line.picked_qty += 1
-        if line.picked_qty == line.expected_qty:
-            line.status = "completed"
-        else:
-            line.status = "in_progress"
-        
-        db.commit()
-        
-        event = Event(
-            session_id=session_id,
-            user_id=current_user.id,
-            type="scan",
-            payload={
-                "code": scanned_code,
-                "matched_field": matched_field,
-                "ean": line.ean,
-                "gtin": line.gtin,
-                "upc": line.upc,
-                "sku": line.sku,
-                "product_name": line.product_name,
-                "picked_qty": line.picked_qty,
-                "expected_qty": line.expected_qty,
-                "result": "valid"
-            }
-        )
-        db.add(event)
-        db.commit()
-    
     return {
         "message": "Scan registered",
-        "picked_qty": line.picked_qty,
-        "expected_qty": line.expected_qty,
-        "matched_field": matched_field,
-        "product_name": line.product_name
+        "picked_qty": outcome["picked_qty"],
+        "expected_qty": outcome["expected_qty"],
+        "matched_field": outcome["matched_field"],
+        "product_name": outcome["product_name"]
     }
 
-@app.post("/sessions/{session_id}/photo", response_model=PhotoResponse)
-async def upload_photo(
-    session_id: str,
-    file: UploadFile = File(...),
+@app.post("/sessions/{session_id}/scans:batch", response_model=BatchScanResponse)
+async def register_scan_batch(
+    session_id: uuid.UUID,
+    batch_request: BatchScanRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    """Apply an ordered list of (usually offline-queued) scans in one transaction.
+    
+    Scans whose idempotency key was already stored for this session are
+    reported as ``duplicate`` with the outcome recorded the first time. The
+    session row is locked so a concurrent retry of the same batch waits and
+    then sees this one's keys.
+    """
+    session = db.query(SessionModel).filter(SessionModel.id == session_id).with_for_update().first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    file_key = f"sessions/{session_id}/{file.filename}"
+    keys = [scan.idempotency_key for scan in batch_request.scans]
+    recorded = dict(
+        db.query(Event.idempotency_key, Event.payload).filter(
+            Event.session_id == session.id,
+            Event.idempotency_key.in_(keys)
+        ).all()
+    )
     
-    try:
-        s3_client.upload_fileobj(file.file, MINIO_BUCKET_NAME, file_key)
-        photo_url = f"http://{MINIO_ENDPOINT}/{MINIO_BUCKET_NAME}/{file_key}"
+    results = []
+    for scan in batch_request.scans:
+        key = scan.idempotency_key
+        if key in recorded:
+            payload = recorded[key] or {}
+            results.append(BatchScanResult(
+                idempotency_key=key,
+                result="duplicate",
+                matched_field=payload.get("matched_field"),
+                picked_qty=payload.get("picked_qty"),
+                expected_qty=payload.get("expected_qty"),
+                product_name=payload.get("product_name")
+            ))
+            continue
         
+        outcome = apply_scan(db, session, current_user, scan.code.strip(), key, scan.client_timestamp)
+        recorded[key] = outcome
+        results.append(BatchScanResult(idempotency_key=key, **outcome))
+    
+    db.commit()
+    
+    return BatchScanResponse(results=results)
+
+AUDIT_PAGE_SIZE = 100
+AUDIT_MAX_PAGE_SIZE = 500
+
+def _encode_cursor(timestamp: datetime, row_id) -> str:
+    """Keyset cursor for lists ordered by ``(timestamp, id)`` descending."""
+    raw = json.dumps([timestamp.isoformat(), str(row_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _record_photo(db: AsyncSession, session_id, user: User, file_key: str) -> PhotoResponse:
+    """Create the photo row for a stored object and queue its variants; reuse the row if it exists."""
+    photo_url = object_url(file_key)
+    
+    # Keys are content hashes, so a re-sent photo maps onto the row it already has.
+    photo = (await db.execute(
+        select(Photo).where(Photo.session_id == session_id, Photo.url == photo_url)
+    )).scalars().first()
+    if photo is None:
         photo = Photo(
             session_id=session_id,
             url=photo_url
         )
         db.add(photo)
-        db.commit()
-        db.refresh(photo)
+        await db.commit()
+        await db.refresh(photo)
         
-        event = Event(
-            session_id=session_id,
-            user_id=current_user.id,
-            type="photo",
-            payload={"url": photo_url}
+        event_writer.emit(session_id, user.id, "photo", {"url": photo_url})
+        photo_pipeline.schedule_variants(photo.id, file_key)
+    elif photo.thumbnail_url is None or photo.webp_url is None:
+        # Variants that failed for good (or were lost in a restart) are rebuilt on re-send.
+        photo_pipeline.schedule_variants(photo.id, file_key)
+    
+    return _photo_responses([photo])[0]
+
+def _photo_responses(photos) -> List[PhotoResponse]:
+    """Photo rows with presigned download URLs in place of the raw MinIO ones."""
+    urls = signed_urls(
+        object_key(url) for photo in photos for url in (photo.url, photo.thumbnail_url, photo.webp_url)
+    )
+    
+    def signed(url):
+        return urls.get(object_key(url), url)
+    
+    return [
+        PhotoResponse(
+            id=photo.id,
+            session_id=photo.session_id,
+            url=signed(photo.url),
+            thumbnail_url=signed(photo.thumbnail_url),
+            webp_url=signed(photo.webp_url),
+            created_at=photo.created_at
         )
-        db.add(event)
-        db.commit()
-        
-        return PhotoResponse(id=photo.id, url=photo.url, created_at=photo.created_at)
+        for photo in photos
+    ]
+
+@app.post("/sessions/{session_id}/photo", response_model=PhotoResponse)
+async def upload_photo(
+    session_id: uuid.UUID,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    session = await db.get(SessionModel, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    except Exception as e:
+    try:
+        file_key = await photo_pipeline.upload(session_id, file.file, file.filename, file.content_type)
+    except PhotoUploadError as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload photo: {str(e)}")
+    
+    return await _record_photo(db, session_id, current_user, file_key)
+
+@app.post("/sessions/{session_id}/photo/presign", response_model=PhotoPresignResponse)
+async def presign_photo_upload(
+    session_id: uuid.UUID,
+    presign_request: PhotoPresignRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Let the client upload a photo straight to MinIO.
+    
+    The client sends the photo's SHA-256 and size, PUTs the file to ``url``
+    with ``headers``, then calls ``/photo/confirm`` with ``key``. MinIO
+    rejects a body that does not match the SHA-256, and confirm reads the
+    checksum it stored. ``exists`` means the same photo is already stored
+    and the upload can be skipped.
+    """
+    session = await db.get(SessionModel, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if presign_request.size > PHOTO_MAX_UPLOAD_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"Photos are limited to {PHOTO_MAX_UPLOAD_MB} MB")
+    
+    file_key = photo_key(session_id, presign_request.sha256, presign_request.filename)
+    try:
+        exists = await photo_pipeline.stat(file_key) is not None
+    except PhotoUploadError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to prepare photo upload: {str(e)}")
+    upload = presign_upload(file_key, presign_request.content_type, presign_request.size)
+    
+    return PhotoPresignResponse(
+        key=file_key,
+        url=upload["url"],
+        headers=upload["headers"],
+        expires_in=PHOTO_PRESIGN_EXPIRES_SECONDS,
+        exists=exists
+    )
+
+@app.post("/sessions/{session_id}/photo/confirm", response_model=PhotoResponse)
+async def confirm_photo_upload(
+    session_id: uuid.UUID,
+    confirm_request: PhotoConfirmRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    session = await db.get(SessionModel, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if not is_photo_key(session_id, confirm_request.key):
+        raise HTTPException(status_code=400, detail="Invalid photo key for this session")
+    
+    try:
+        verified = await photo_pipeline.verify(confirm_request.key)
+    except PhotoUploadError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to check photo upload: {str(e)}")
+    if verified is None:
+        raise HTTPException(status_code=400, detail="Photo has not been uploaded")
+    if not verified:
+        raise HTTPException(status_code=422, detail="Uploaded photo does not match its SHA-256; upload it again")
+    
+    return await _record_photo(db, session_id, current_user, confirm_request.key)
+
+@app.get("/sessions/{session_id}/photos", response_model=List[PhotoResponse])
+async def get_session_photos(
+    session_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    session = await db.get(SessionModel, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if session.user_id != current_user.id and current_user.role not in ["admin", "supervisor"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    photos = (await db.execute(
+        select(Photo).where(Photo.session_id == session_id).order_by(Photo.created_at, Photo.id)
+    )).scalars().all()
+    return _photo_responses(photos)
+
+@app.get("/photos")
+async def get_photo_gallery(
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE),
+    warehouse_id: Optional[uuid.UUID] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """All photos newest first, paged like ``/admin/audit/sessions``.
+    
+    URLs are presigned and stay the same for most of their lifetime, so the
+    browser cache serves images already seen on earlier pages.
+    """
+    if current_user.role not in ["admin", "supervisor"]:
+        raise HTTPException(status_code=403, detail="Access denied. Admin or supervisor role required.")
+    
+    query = select(Photo)
+    if warehouse_id:
+        query = query.join(SessionModel, SessionModel.id == Photo.session_id).where(SessionModel.warehouse_id == warehouse_id)
+    if created_from:
+        query = query.where(Photo.created_at >= created_from)
+    if created_to:
+        query = query.where(Photo.created_at < created_to)
+    if cursor:
+        query = query.where(tuple_(Photo.created_at, Photo.id) < tuple_(*_decode_cursor(cursor)))
+    photos = (await db.execute(
+        query.order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit + 1)
+    )).scalars().all()
+    
+    next_cursor = None
+    if len(photos) > limit:
+        photos = photos[:limit]
+        next_cursor = _encode_cursor(photos[-1].created_at, photos[-1].id)
+    
+    return {
+        "items": _photo_responses(photos),
+        "next_cursor": next_cursor
+    }
+
+def close_session(db: Session, session_id):
+    """Mark the session finished without committing; ``None`` if it already was.
+    
+    Like the scan UPDATE, the guard makes concurrent closes (a finish and an
+    exception approval, or a retried finish) serialize on the row lock, so
+    only the one that gets the row back records the rollups and queues the
+    order write-back.
+    """
+    return db.execute(
+        update(SessionModel)
+        .where(SessionModel.id == session_id, SessionModel.status != "finished")
+        .values(status="finished", finished_at=datetime.utcnow())
+        .returning(
+            SessionModel.id, SessionModel.order_id, SessionModel.user_id, SessionModel.warehouse_id,
+            SessionModel.started_at, SessionModel.finished_at
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
 
 @app.post("/sessions/{session_id}/finish")
 async def finish_session(
-    session_id: str,
+    session_id: uuid.UUID,
     finish_request: FinishSessionRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    lines = db.query(Line).filter(Line.session_id == session_id).all()
-    photos = db.query(Photo).filter(Photo.session_id == session_id).all()
+    lines = (await db.execute(select(Line).where(Line.session_id == session_id))).scalars().all()
+    photo = (await db.execute(select(Photo.id).where(Photo.session_id == session_id).limit(1))).first()
     
-    if not photos:
+    if not photo:
         raise HTTPException(status_code=400, detail="At least one photo is required")
     
     all_completed = all(line.picked_qty == line.expected_qty for line in lines)
     if not all_completed:
         raise HTTPException(status_code=400, detail="Not all items have been picked")
     
-    session.status = "finished"
-    session.finished_at = datetime.utcnow()
-    db.commit()
+    def record_finish(sync_db):
+        closed = close_session(sync_db, session_id)
+        if closed:
+            record_session_finished(sync_db, closed, lines)
+            enqueue_order_status(sync_db, closed, current_user.id, "completed", "finish", {"order_status": "completed"})
+        return closed
     
-    if update_woocommerce_order_status(session.order_id, "completed"):
-        event = Event(
-            session_id=session_id,
-            user_id=current_user.id,
-            type="finish",
-            payload={"order_status": "completed"}
-        )
-        db.add(event)
-        db.commit()
+    if await db.run_sync(record_finish):
+        await db.commit()
+        outbox_worker.notify()
+    forget_session(session.id)
     
     return {"message": "Session completed successfully"}
 
 
+async def _compute_metrics_snapshot(key):
+    day_from, day_to, warehouse_id = key
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(compute_metrics, day_from, day_to, warehouse_id)
+
+metrics_snapshots = MetricsSnapshotCache(_compute_metrics_snapshot)
+
 @app.get("/metrics", response_model=MetricsResponse)
-async def get_metrics(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_metrics(
+    request: Request,
+    day_from: Optional[date] = Query(None, alias="from"),
+    day_to: Optional[date] = Query(None, alias="to"),
+    warehouse_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Dashboard metrics, optionally limited to UTC days ``from``..``to`` (inclusive) and one warehouse."""
     if current_user.role not in ["admin", "supervisor"]:
         raise HTTPException(status_code=403, detail="Access denied. Admin or supervisor role required.")
     
-    total_completed = db.query(SessionModel).filter(SessionModel.status == "finished").count()
-    
-    total_active = db.query(SessionModel).filter(SessionModel.status == "in_progress").count()
-    
-    completed_sessions = db.query(SessionModel).filter(
-        SessionModel.status == "finished",
-        SessionModel.finished_at.isnot(None)
-    ).all()
-    
-    avg_picking_time = 0.0
-    if completed_sessions:
-        total_time = sum([
-            (session.finished_at - session.started_at).total_seconds() / 60
-            for session in completed_sessions
-        ])
-        avg_picking_time = total_time / len(completed_sessions)
-    
-    picker_stats = db.query(
-        User.username,
-        User.role,
-        func.count(SessionModel.id).label('completed_orders'),
-        func.sum(Line.picked_qty).label('total_items')
-    ).join(SessionModel, User.id == SessionModel.user_id)\
-     .join(Line, SessionModel.id == Line.session_id)\
-     .filter(SessionModel.status == "finished")\
-     .group_by(User.id, User.username, User.role).all()
-    
-    picker_metrics = []
-    for stat in picker_stats:
-        picker_sessions = db.query(SessionModel).filter(
-            SessionModel.user_id == db.query(User.id).filter(User.username == stat.username).scalar(),
-            SessionModel.status == "finished",
-            SessionModel.finished_at.isnot(None)
-        ).all()
-        
-        picker_avg_time = 0.0
-        if picker_sessions:
-            picker_total_time = sum([
-                (session.finished_at - session.started_at).total_seconds() / 60
-                for session in picker_sessions
-            ])
-            picker_avg_time = picker_total_time / len(picker_sessions)
-        
-        picker_metrics.append(PickerMetrics(
-            picker_username=stat.username,
-            picker_role=stat.role,
-            completed_orders=stat.completed_orders,
-            avg_picking_time_minutes=round(picker_avg_time, 2),
-            total_items_picked=stat.total_items or 0
-        ))
-    
-    error_products = db.query(
-        Line.ean,
-        func.count(Line.id).label('error_count'),
-        func.sum(Line.expected_qty).label('total_expected'),
-        func.sum(Line.picked_qty).label('total_picked')
-    ).filter(Line.picked_qty != Line.expected_qty)\
-     .group_by(Line.ean)\
-     .order_by(desc('error_count'))\
-     .limit(10).all()
-    
-    product_metrics = []
-    for product in error_products:
-        total_lines = db.query(func.count(Line.id)).filter(Line.ean == product.ean).scalar()
-        error_rate = (product.error_count / total_lines * 100) if total_lines > 0 else 0
-        
-        product_metrics.append(ProductMetrics(
-            ean=product.ean,
-            product_name=f"Producto {product.ean}",
-            error_count=product.error_count,
-            total_picked=product.total_picked or 0,
-            error_rate=round(error_rate, 2)
-        ))
-    
-    incidents = db.query(SessionModel).join(Line)\
-                  .filter(SessionModel.status == "finished")\
-                  .filter(Line.picked_qty < Line.expected_qty)\
-                  .distinct().count()
-    
-    return MetricsResponse(
-        total_completed_orders=total_completed,
-        total_active_sessions=total_active,
-        avg_picking_time_minutes=round(avg_picking_time, 2),
-        picker_metrics=picker_metrics,
-        top_error_products=product_metrics,
-        incidents_count=incidents
-    )
+    snapshot = await metrics_snapshots.get((day_from, day_to, warehouse_id))
+    headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 @app.post("/sessions/{session_id}/exception", response_model=ExceptionResponse)
 async def create_exception(
@@ -642,14 +797,7 @@ async def create_exception(
     db.commit()
     db.refresh(exception)
     
-    event = Event(
-        session_id=session_id,
-        user_id=current_user.id,
-        type="exception_created",
-        payload={"reason": exception_request.reason}
-    )
-    db.add(event)
-    db.commit()
+    event_writer.emit(session_id, current_user.id, "exception_created", {"reason": exception_request.reason})
     
     return ExceptionResponse(
         id=exception.id,
@@ -688,7 +836,7 @@ async def get_pending_exceptions(
 
 @app.post("/exceptions/{exception_id}/approve")
 async def approve_exception(
-    exception_id: str,
+    exception_id: uuid.UUID,
     approve_request: ApproveExceptionRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -710,32 +858,28 @@ async def approve_exception(
     session = db.query(SessionModel).filter(SessionModel.id == exception.session_id).first()
     
     if approve_request.approved and session:
-        session.status = "finished"
-        session.finished_at = datetime.utcnow()
-        
-        if update_woocommerce_order_status(session.order_id, "completed"):
-            event = Event(
-                session_id=exception.session_id,
-                user_id=current_user.id,
-                type="exception_approved",
-                payload={
-                    "exception_id": str(exception.id),
-                    "approved": True,
-                    "notes": approve_request.notes,
-                    "order_status": "completed"
-                }
-            )
-        else:
-            event = Event(
-                session_id=exception.session_id,
-                user_id=current_user.id,
-                type="exception_approved",
-                payload={
-                    "exception_id": str(exception.id),
-                    "approved": True,
-                    "notes": approve_request.notes
-                }
+        closed = close_session(db, session.id)
+        if closed:
+            lines = db.query(
+                Line.ean, Line.product_name, Line.picked_qty, Line.expected_qty
+            ).filter(Line.session_id == session.id).all()
+            record_session_finished(db, closed, lines)
+            enqueue_order_status(
+                db, closed, current_user.id, "completed", "finish",
+                {"order_status": "completed", "exception_id": str(exception.id)}
             )
+        forget_session(session.id)
+        
+        event = Event(
+            session_id=exception.session_id,
+            user_id=current_user.id,
+            type="exception_approved",
+            payload={
+                "exception_id": str(exception.id),
+                "approved": True,
+                "notes": approve_request.notes
+            }
+        )
     else:
         event = Event(
             session_id=exception.session_id,
@@ -750,27 +894,29 @@ async def approve_exception(
     
     db.add(event)
     db.commit()
+    outbox_worker.notify()
     
     return {"message": f"Exception {'approved' if approve_request.approved else 'rejected'} successfully"}
 
 @app.get("/sessions/{session_id}/lines")
 async def get_session_lines(
-    session_id: str,
+    session_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     if session.user_id != current_user.id and current_user.role not in ["admin", "supervisor"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    lines = db.query(Line).filter(Line.session_id == session_id).all()
+    lines = (await db.execute(select(Line).where(Line.session_id == session_id))).scalars().all()
     
+    products = await get_woocommerce_products(line.product_id for line in lines)
     lines_with_details = []
     for line in lines:
-        product_details = get_woocommerce_product_details(line.product_id)
+        product_details = products.get(line.product_id)
         lines_with_details.append({
             "id": str(line.id),
             "product_id": line.product_id,
@@ -858,7 +1004,7 @@ async def create_user(
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    hashed_password = get_password_hash(user_data["password"])
+    hashed_password = await get_password_hash(user_data["password"])
     
     warehouse_id = None
     if user_data.get("warehouse_id"):
@@ -900,6 +1046,7 @@ async def update_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    previous_username = user.username
     if "username" in user_data:
         user.username = user_data["username"]
     if "role" in user_data:
@@ -914,9 +1061,10 @@ async def update_user(
                 pass
         user.warehouse_id = warehouse_id
     if "password" in user_data and user_data["password"]:
-        user.password_hash = get_password_hash(user_data["password"])
+        user.password_hash = await get_password_hash(user_data["password"])
     
     db.commit()
+    await invalidate_cached_user(previous_username, user.username)
     
     return {"message": "User updated successfully"}
 
@@ -936,32 +1084,78 @@ async def deactivate_user(
     if user.id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot deactivate yourself")
     
+    username = user.username
     db.delete(user)
     db.commit()
+    await invalidate_cached_user(username)
     
     return {"message": "User deactivated successfully"}
 
+def _session_filters(
+    session_status: Optional[str] = None,
+    user_id: Optional[uuid.UUID] = None,
+    warehouse_id: Optional[uuid.UUID] = None,
+    started_from: Optional[datetime] = None,
+    started_to: Optional[datetime] = None
+) -> list:
+    filters = []
+    if session_status:
+        filters.append(SessionModel.status == session_status)
+    if user_id:
+        filters.append(SessionModel.user_id == user_id)
+    if warehouse_id:
+        filters.append(SessionModel.warehouse_id == warehouse_id)
+    if started_from:
+        filters.append(SessionModel.started_at >= started_from)
+    if started_to:
+        filters.append(SessionModel.started_at < started_to)
+    return filters
+
+def _audit_session(session: SessionModel) -> dict:
+    return {
+        "id": str(session.id),
+        "order_id": session.order_id,
+        "user_id": str(session.user_id),
+        "status": session.status,
+        "started_at": session.started_at.isoformat(),
+        "finished_at": session.finished_at.isoformat() if session.finished_at else None,
+        "warehouse_id": str(session.warehouse_id) if session.warehouse_id else None
+    }
+
 @app.get("/admin/audit/sessions")
 async def get_all_sessions(
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE),
+    session_status: Optional[str] = Query(None, alias="status"),
+    user_id: Optional[uuid.UUID] = None,
+    warehouse_id: Optional[uuid.UUID] = None,
+    started_from: Optional[datetime] = None,
+    started_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Sessions newest first, one page at a time.
+    
+    Pass the returned ``next_cursor`` back as ``cursor`` to get the next page;
+    it is ``None`` on the last page.
+    """
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    sessions = db.query(SessionModel).all()
-    return [
-        {
-            "id": str(session.id),
-            "order_id": session.order_id,
-            "user_id": str(session.user_id),
-            "status": session.status,
-            "started_at": session.started_at.isoformat(),
-            "finished_at": session.finished_at.isoformat() if session.finished_at else None,
-            "warehouse_id": str(session.warehouse_id) if session.warehouse_id else None
-        }
-        for session in sessions
-    ]
+    query = db.query(SessionModel).filter(*_session_filters(session_status, user_id, warehouse_id, started_from, started_to))
+    if cursor:
+        query = query.filter(tuple_(SessionModel.started_at, SessionModel.id) < tuple_(*_decode_cursor(cursor)))
+    sessions = query.order_by(SessionModel.started_at.desc(), SessionModel.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = _encode_cursor(sessions[-1].started_at, sessions[-1].id)
+    
+    return {
+        "items": [_audit_session(session) for session in sessions],
+        "next_cursor": next_cursor
+    }
 
 @app.get("/admin/audit/orders")
 async def get_all_orders_audit(
@@ -971,18 +1165,25 @@ async def get_all_orders_audit(
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    orders = get_woocommerce_orders()
-    sessions = db.query(SessionModel).all()
+    orders = [row.data for row in db.query(Order.data).filter(Order.status == "processing").order_by(Order.id.desc())]
+    
+    sessions_by_order = defaultdict(list)
+    if orders:
+        sessions = db.query(SessionModel).filter(
+            SessionModel.order_id.in_([order["id"] for order in orders])
+        ).order_by(SessionModel.order_id, SessionModel.started_at).all()
+        for s in sessions:
+            sessions_by_order[s.order_id].append(s)
     
     orders_with_sessions = []
     for order in orders:
-        order_sessions = [s for s in sessions if s.order_id == order["id"]]
+        billing = order.get("billing", {})
         orders_with_sessions.append({
             "order_id": order["id"],
             "order_number": order["number"],
             "status": order["status"],
             "total": order["total"],
-            "customer_name": f"{order['billing']['first_name']} {order['billing']['last_name']}",
+            "customer_name": f"{billing.get('first_name', '')} {billing.get('last_name', '')}",
             "sessions": [
                 {
                     "id": str(s.id),
@@ -991,12 +1192,184 @@ async def get_all_orders_audit(
                     "started_at": s.started_at.isoformat(),
                     "finished_at": s.finished_at.isoformat() if s.finished_at else None
                 }
-                for s in order_sessions
+                for s in sessions_by_order[order["id"]]
             ]
         })
     
     return orders_with_sessions
 
+def _audit_event(event: Event) -> dict:
+    return {
+        "id": str(event.id),
+        "session_id": str(event.session_id),
+        "user_id": str(event.user_id),
+        "type": event.type,
+        "payload": event.payload,
+        "created_at": event.created_at.isoformat()
+    }
+
+@app.get("/admin/audit/events")
+async def get_events(
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE),
+    event_type: Optional[str] = Query(None, alias="type"),
+    user_id: Optional[uuid.UUID] = None,
+    session_id: Optional[uuid.UUID] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    code: Optional[str] = None,
+    result: Optional[str] = None,
+    matched_field: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Event history newest first, e.g. every invalid scan of one code in a week.
+    
+    ``code``, ``result`` and ``matched_field`` match the scan payload keys of
+    the same name. Paged like ``/admin/audit/sessions``.
+    """
+    if current_user.role not in ["admin", "supervisor"]:
+        raise HTTPException(status_code=403, detail="Access denied. Admin or supervisor role required.")
+    
+    filters = []
+    if event_type:
+        filters.append(Event.type == event_type)
+    if user_id:
+        filters.append(Event.user_id == user_id)
+    if session_id:
+        filters.append(Event.session_id == session_id)
+    if created_from:
+        filters.append(Event.created_at >= created_from)
+    if created_to:
+        filters.append(Event.created_at < created_to)
+    if code:
+        # Long codes are indexed by their prefix, the same way they were stored.
+        filters.append(Event.code == indexed_fields({"code": code})["code"])
+    if result:
+        filters.append(Event.result == result)
+    if matched_field:
+        filters.append(Event.matched_field == matched_field)
+    
+    query = db.query(Event).filter(*filters)
+    if cursor:
+        query = query.filter(tuple_(Event.created_at, Event.id) < tuple_(*_decode_cursor(cursor)))
+    events = query.order_by(Event.created_at.desc(), Event.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = _encode_cursor(events[-1].created_at, events[-1].id)
+    
+    return {
+        "items": [_audit_event(event) for event in events],
+        "next_cursor": next_cursor
+    }
+
+def _outbox_job(job: OutboxJob) -> dict:
+    return {
+        "id": str(job.id),
+        "session_id": str(job.session_id),
+        "order_id": job.order_id,
+        "order_status": job.order_status,
+        "state": job.state,
+        "attempts": job.attempts,
+        "next_attempt_at": job.next_attempt_at.isoformat(),
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None
+    }
+
+@app.get("/admin/outbox")
+async def get_outbox_jobs(
+    state: str = Query("dead", pattern="^(pending|done|dead)$"),
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """WooCommerce write-back jobs in one state, most recently scheduled first (dead letters by default)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    jobs = db.query(OutboxJob).filter(OutboxJob.state == state).order_by(
+        OutboxJob.next_attempt_at.desc()
+    ).limit(limit).all()
+    return [_outbox_job(job) for job in jobs]
+
+@app.post("/admin/outbox/{job_id}/retry")
+async def retry_outbox_job(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = db.query(OutboxJob).filter(OutboxJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state == "done":
+        raise HTTPException(status_code=400, detail="Job has already been delivered")
+    
+    job.state = "pending"
+    job.attempts = 0
+    job.next_attempt_at = datetime.utcnow()
+    db.commit()
+    outbox_worker.notify()
+    
+    return _outbox_job(job)
+
+@app.post("/webhooks/woocommerce")
+async def woocommerce_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Receiver for WooCommerce ``order.created``/``order.updated``/``order.deleted`` webhooks."""
+    body = await request.body()
+    if not verify_webhook_signature(body, request.headers.get("x-wc-webhook-signature")):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    topic = request.headers.get("x-wc-webhook-topic", "")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        # WooCommerce pings a new webhook with a form-encoded body.
+        return {"message": "ignored"}
+    
+    if topic in ("order.created", "order.updated", "order.restored"):
+        await db.run_sync(upsert_orders, [payload])
+    elif topic == "order.deleted":
+        await db.run_sync(delete_orders, [payload.get("id")])
+    else:
+        return {"message": "ignored"}
+    await db.commit()
+    if payload.get("id") is not None:
+        await invalidate_woocommerce_order(payload["id"])
+    
+    return {"message": "ok"}
+
+@app.get("/admin/export/{entity}")
+async def export_entity(
+    entity: str,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    warehouse_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every session, line or event matching the filters as NDJSON or CSV."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if entity not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(
+            contextmanager(get_db), entity, export_format,
+            date_from=date_from, date_to=date_to, warehouse_id=warehouse_id
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{export_format}"'}
+    )
+
 from fastapi import APIRouter
 
 api_router = APIRouter(prefix="/api")
@@ -1009,73 +1382,61 @@ async def login_api(user_login: UserLogin, db: Session = Depends(get_db)):
 async def register_api(user_register: UserRegister, db: Session = Depends(get_db)):
     return await register(user_register, db)
 
+def _order_response(order: dict, products: Optional[dict] = None) -> OrderResponse:
+    customer_name = f"{order.get('billing', {}).get('first_name', '')} {order.get('billing', {}).get('last_name', '')}".strip()
+    if not customer_name:
+        customer_name = "Cliente desconocido"
+    
+    line_items = []
+    for item in order.get('line_items', []):
+        product_details = products.get(item.get("product_id")) if products else None
+        line_items.append(LineItem(
+            id=item.get('id', 0),
+            name=item.get('name', ''),
+            ean=item.get('sku', ''),
+            quantity=item.get('quantity', 0),
+            product_id=item.get('product_id', 0),
+            image_url=product_details.get('image_url') if product_details else None
+        ))
+    
+    return OrderResponse(
+        id=order["id"],
+        number=order.get("number", str(order["id"])),
+        status=order.get("status", "unknown"),
+        total=order.get("total", "0.00"),
+        customer_name=customer_name,
+        line_items=line_items
+    )
+
 @api_router.get("/orders", response_model=List[OrderResponse])
-async def get_orders_api(current_user: User = Depends(get_current_user)):
+async def get_orders_api(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Processing orders from the local ``orders`` table (kept current by webhooks), newest first."""
     if current_user.role not in ["admin", "supervisor", "picker"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    try:
-        orders = get_woocommerce_orders()
-        order_responses = []
-        for order in orders:
-            customer_name = f"{order.get('billing', {}).get('first_name', '')} {order.get('billing', {}).get('last_name', '')}".strip()
-            if not customer_name:
-                customer_name = "Cliente desconocido"
-            
-            line_items = []
-            for item in order.get('line_items', []):
-                line_items.append(LineItem(
-                    id=item.get('id', 0),
-                    name=item.get('name', ''),
-                    ean=item.get('sku', ''),
-                    quantity=item.get('quantity', 0),
-                    product_id=item.get('product_id', 0)
-                ))
-            
-            order_responses.append(OrderResponse(
-                id=order["id"],
-                number=order.get("number", str(order["id"])),
-                status=order.get("status", "unknown"),
-                total=order.get("total", "0.00"),
-                customer_name=customer_name,
-                line_items=line_items
-            ))
-        return order_responses
-    except Exception as e:
-        print(f"Error fetching orders: {e}")
-        return []
+    orders = (await db.execute(
+        select(Order.data).where(Order.status == "processing").order_by(Order.id.desc())
+    )).scalars().all()
+    return [_order_response(order) for order in orders]
 
 @api_router.get("/orders/{order_id}", response_model=OrderResponse)
-async def get_order_detail_api(order_id: int, current_user: User = Depends(get_current_user)):
+async def get_order_detail_api(
+    order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
-        orders = get_woocommerce_orders()
-        order = next((o for o in orders if o["id"] == order_id), None)
+        order = (await db.execute(select(Order.data).where(Order.id == order_id))).scalar()
+        if order is None:
+            order = await get_woocommerce_order(order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
-        customer_name = f"{order.get('billing', {}).get('first_name', '')} {order.get('billing', {}).get('last_name', '')}".strip()
-        if not customer_name:
-            customer_name = "Cliente desconocido"
-        
-        line_items = []
-        for item in order.get('line_items', []):
-            product_details = get_woocommerce_product_details(item["product_id"])
-            line_items.append(LineItem(
-                id=item.get('id', 0),
-                name=item.get('name', ''),
-                ean=item.get('sku', ''),
-                quantity=item.get('quantity', 0),
-                product_id=item.get('product_id', 0)
-            ))
-        
-        return OrderResponse(
-            id=order["id"],
-            number=order.get("number", str(order["id"])),
-            status=order.get("status", "unknown"),
-            total=order.get("total", "0.00"),
-            customer_name=customer_name,
-            line_items=line_items
-        )
+        products = await get_woocommerce_products(item["product_id"] for item in order.get('line_items', []))
+        return _order_response(order, products)
         
     except HTTPException:
         raise
@@ -1093,22 +1454,24 @@ async def start_picking_session_api(order_id: int, current_user: User = Depends(
     if existing_session:
         raise HTTPException(status_code=400, detail="Session already in progress for this order")
     
-    orders = get_woocommerce_orders()
-    order = next((o for o in orders if o["id"] == order_id), None)
-    if not order:
+    order = await get_woocommerce_order(order_id)
+    if not order or order.get("status") != "processing":
         raise HTTPException(status_code=404, detail="Order not found")
     
     session = SessionModel(
         order_id=order_id,
         user_id=current_user.id,
+        warehouse_id=current_user.warehouse_id,
         status="in_progress"
     )
     db.add(session)
     db.commit()
     db.refresh(session)
     
+    products = await get_woocommerce_products(item["product_id"] for item in order["line_items"])
+    lines = []
     for item in order["line_items"]:
-        product_details = get_woocommerce_product_details(item["product_id"])
+        product_details = products.get(item["product_id"])
         sku = item.get("sku") or ""
         ean = ""
         gtin = ""
@@ -1116,9 +1479,9 @@ async def start_picking_session_api(order_id: int, current_user: User = Depends(
         product_name = item.get("name") or ""
         
         if product_details:
-            ean = product_details.get("ean") or product_details.get("_ean") or product_details.get("_alg_ean") or ""
-            gtin = product_details.get("gtin") or product_details.get("_gtin") or ""
-            upc = product_details.get("upc") or product_details.get("_upc") or ""
+            ean = product_details.get("ean") or ""
+            gtin = product_details.get("gtin") or ""
+            upc = product_details.get("upc") or ""
             if not product_name:
                 product_name = product_details.get("name") or ""
         
@@ -1135,16 +1498,24 @@ async def start_picking_session_api(order_id: int, current_user: User = Depends(
             status="pending"
         )
         db.add(line)
+        lines.append(line)
     
+    db.flush()
+    remember_session_lines(session.id, lines)
     db.commit()
     
     return SessionResponse(
         id=session.id,
         order_id=session.order_id,
+        warehouse_id=session.warehouse_id,
         status=session.status,
         started_at=session.started_at
     )
 
+@api_router.post("/webhooks/woocommerce")
+async def woocommerce_webhook_api(request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await woocommerce_webhook(request, db)
+
 @api_router.get("/health")
 async def health_api():
     return health()
@@ -1152,8 +1523,7 @@ async def health_api():
 async def generate_qr_label_api(order_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Generate QR label data for a completed order"""
     try:
-        orders = get_woocommerce_orders()
-        order = next((o for o in orders if o["id"] == order_id), None)
+        order = await get_woocommerce_order(order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
@@ -1226,7 +1596,7 @@ async def create_emergency_admin(db: Session = Depends(get_db)):
         if existing_admin:
             return {"message": "Admin user already exists", "status": "exists"}
         
-        hashed_password = get_password_hash("admin123")
+        hashed_password = await get_password_hash("admin123")
         admin_user = User(
             username="admin",
             password_hash=hashed_password,
@@ -1264,6 +1634,7 @@ async def assign_user_warehouse(
     
     user.warehouse_id = warehouse_id
     db.commit()
+    await invalidate_cached_user(user.username)
     
     return {"message": "Usuario asignado al almacén correctamente"}
 
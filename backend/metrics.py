@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import date
+from typing import Callable, Optional
+
+from sqlalchemy import select, func, desc
+from sqlalchemy.orm import Session
+
+from models import User, SessionModel, PickerDailyMetrics, ProductDailyMetrics
+from cache import TTLCache
+from schemas import MetricsResponse, PickerMetrics, ProductMetrics
+
+METRICS_FRESH_SECONDS = float(os.getenv("METRICS_FRESH_SECONDS", 15))
+METRICS_MAX_STALE_SECONDS = float(os.getenv("METRICS_MAX_STALE_SECONDS", 300))
+
+
+def _avg_minutes(duration_seconds, sessions) -> float:
+    return round(float(duration_seconds) / sessions / 60, 2) if sessions else 0.0
+
+
+def _rollup_filters(model, day_from: Optional[date], day_to: Optional[date], warehouse_id) -> list:
+    filters = []
+    if day_from is not None:
+        filters.append(model.day >= day_from)
+    if day_to is not None:
+        filters.append(model.day <= day_to)
+    if warehouse_id is not None:
+        filters.append(model.warehouse_id == warehouse_id)
+    return filters
+
+
+def compute_metrics(db: Session, day_from: Optional[date] = None, day_to: Optional[date] = None,
+                    warehouse_id=None) -> MetricsResponse:
+    """Build the supervisor dashboard from the rollup tables maintained by ``rollups``.
+
+    Only the active-session count is read from ``sessions``; everything else
+    sums a handful of pre-aggregated rows. ``day_from``/``day_to`` are
+    inclusive UTC days, matched against the finish day for picker figures and
+    the session start day for product errors.
+    """
+    picker_filters = _rollup_filters(PickerDailyMetrics, day_from, day_to, warehouse_id)
+    product_filters = _rollup_filters(ProductDailyMetrics, day_from, day_to, warehouse_id)
+
+    totals = db.execute(
+        select(
+            func.sum(PickerDailyMetrics.completed_sessions).label("completed"),
+            func.sum(PickerDailyMetrics.duration_seconds).label("duration_seconds"),
+            func.sum(PickerDailyMetrics.incident_sessions).label("incidents")
+        )
+        .where(*picker_filters)
+    ).one()
+
+    active_query = select(func.count(SessionModel.id)).where(SessionModel.status == "in_progress")
+    if warehouse_id is not None:
+        active_query = active_query.where(SessionModel.warehouse_id == warehouse_id)
+    total_active = db.execute(active_query).scalar()
+
+    picker_rows = db.execute(
+        select(
+            User.username,
+            User.role,
+            func.sum(PickerDailyMetrics.completed_sessions).label("completed_orders"),
+            func.sum(PickerDailyMetrics.duration_seconds).label("duration_seconds"),
+            func.sum(PickerDailyMetrics.items_picked).label("total_items")
+        )
+        .select_from(PickerDailyMetrics)
+        .join(User, User.id == PickerDailyMetrics.user_id)
+        .where(*picker_filters)
+        .group_by(User.id, User.username, User.role)
+    ).all()
+
+    error_lines = func.sum(ProductDailyMetrics.error_lines)
+    product_rows = db.execute(
+        select(
+            ProductDailyMetrics.ean,
+            func.max(ProductDailyMetrics.product_name).label("product_name"),
+            error_lines.label("error_count"),
+            func.sum(ProductDailyMetrics.total_lines).label("total_lines"),
+            func.sum(ProductDailyMetrics.error_picked).label("total_picked")
+        )
+        .where(*product_filters)
+        .group_by(ProductDailyMetrics.ean)
+        .having(error_lines > 0)
+        .order_by(desc("error_count"))
+        .limit(10)
+    ).all()
+
+    return MetricsResponse(
+        total_completed_orders=totals.completed or 0,
+        total_active_sessions=total_active or 0,
+        avg_picking_time_minutes=_avg_minutes(totals.duration_seconds, totals.completed),
+        picker_metrics=[
+            PickerMetrics(
+                picker_username=row.username,
+                picker_role=row.role,
+                completed_orders=row.completed_orders,
+                avg_picking_time_minutes=_avg_minutes(row.duration_seconds, row.completed_orders),
+                total_items_picked=row.total_items or 0
+            )
+            for row in picker_rows
+        ],
+        top_error_products=[
+            ProductMetrics(
+                ean=row.ean,
+                product_name=row.product_name or f"Producto {row.ean}",
+                error_count=row.error_count,
+                total_picked=row.total_picked or 0,
+                error_rate=round(row.error_count / row.total_lines * 100, 2) if row.total_lines else 0
+            )
+            for row in product_rows
+        ],
+        incidents_count=totals.incidents or 0
+    )
+
+
+def _log_refresh_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error refreshing metrics snapshot: {task.exception()}")
+
+
+class MetricsSnapshot:
+    def __init__(self, metrics: MetricsResponse):
+        self.body = json.dumps(metrics.model_dump(mode="json"), separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.created_at = time.monotonic()
+
+
+class MetricsSnapshotCache:
+    """Serves dashboard snapshots with stale-while-revalidate semantics.
+
+    A snapshot younger than ``fresh_seconds`` is returned as is. An older one
+    is still returned, up to ``max_stale_seconds``, while a single background
+    task recomputes it; past that the request waits for the recomputation.
+    Concurrent requests for the same key share one computation, which is the
+    awaitable ``compute(key)``.
+    """
+
+    def __init__(self, compute: Callable, fresh_seconds: float = METRICS_FRESH_SECONDS,
+                 max_stale_seconds: float = METRICS_MAX_STALE_SECONDS):
+        self.compute = compute
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._snapshots = TTLCache(maxsize=256, ttl_seconds=max_stale_seconds)
+        self._refreshing = {}
+
+    def _refresh(self, key) -> asyncio.Task:
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._recompute(key))
+            task.add_done_callback(_log_refresh_failure)
+            self._refreshing[key] = task
+        return task
+
+    async def _recompute(self, key) -> MetricsSnapshot:
+        try:
+            snapshot = MetricsSnapshot(await self.compute(key))
+            self._snapshots.set(key, snapshot)
+            return snapshot
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get(self, key) -> MetricsSnapshot:
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.created_at
+            if age < self.fresh_seconds:
+                return snapshot
+            if age < self.max_stale_seconds:
+                self._refresh(key)
+                return snapshot
+        return await asyncio.shield(self._refresh(key))
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, Float, Date, DateTime, ForeignKey, Text, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
+from datetime import datetime
 from database import Base
 
 class Warehouse(Base):
@@ -39,7 +40,9 @@ class SessionModel(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     warehouse_id = Column(UUID(as_uuid=True), ForeignKey("warehouses.id"), nullable=True)
     status = Column(String(50), nullable=False)
-    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Python-side defaults keep the keyset columns in the same format as the
+    # cursors bound against them (SQLite's CURRENT_TIMESTAMP has no fraction).
+    started_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     finished_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -50,6 +53,11 @@ class SessionModel(Base):
     photos = relationship("Photo", back_populates="session")
     events = relationship("Event", back_populates="session")
     exceptions = relationship("Exception")
+    
+    __table_args__ = (
+        Index("idx_sessions_warehouse_status_finished", "warehouse_id", "status", "finished_at"),
+        Index("idx_sessions_started_at_id", "started_at", "id"),
+    )
 
 class Line(Base):
     __tablename__ = "lines"
@@ -69,6 +77,13 @@ class Line(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     session = relationship("SessionModel", back_populates="lines")
+    
+    __table_args__ = (
+        Index("idx_lines_session_ean", "session_id", "ean"),
+        Index("idx_lines_session_gtin", "session_id", "gtin"),
+        Index("idx_lines_session_upc", "session_id", "upc"),
+        Index("idx_lines_session_sku", "session_id", "sku"),
+    )
 
 class Photo(Base):
     __tablename__ = "photos"
@@ -77,9 +92,15 @@ class Photo(Base):
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id"), nullable=False)
     line_id = Column(UUID(as_uuid=True), ForeignKey("lines.id"), nullable=True)
     url = Column(String(500), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    thumbnail_url = Column(String(500), nullable=True)
+    webp_url = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     
     session = relationship("SessionModel", back_populates="photos")
+    
+    __table_args__ = (
+        Index("idx_photos_created_at_id", "created_at", "id"),
+    )
 
 class Event(Base):
     __tablename__ = "events"
@@ -89,10 +110,22 @@ class Event(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     type = Column(String(50), nullable=False)
     payload = Column(JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String(255), nullable=True)
+    # Copies of the payload keys scan history is searched by, so they can be indexed.
+    code = Column(String(255), nullable=True)
+    result = Column(String(20), nullable=True)
+    matched_field = Column(String(20), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     
     session = relationship("SessionModel", back_populates="events")
     user = relationship("User")
+    
+    __table_args__ = (
+        Index("idx_events_session_idempotency_key", "session_id", "idempotency_key"),
+        Index("idx_events_code_created_at", "code", "created_at"),
+        Index("idx_events_type_created_at", "type", "created_at"),
+        Index("idx_events_user_created_at", "user_id", "created_at"),
+    )
 
 class Exception(Base):
     __tablename__ = "exceptions"
@@ -118,3 +151,65 @@ class SystemConfig(Base):
     config_value = Column(JSON, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Order(Base):
+    """Local copy of a WooCommerce order, kept current by webhooks and the reconciliation sweep."""
+    __tablename__ = "orders"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    number = Column(String(50), nullable=False)
+    status = Column(String(50), nullable=False)
+    data = Column(JSON, nullable=False)
+    modified_at = Column(DateTime, nullable=True)
+    synced_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index("idx_orders_status_id", "status", "id"),
+    )
+
+class OutboxJob(Base):
+    """A WooCommerce order status write-back, committed with the change that requires it."""
+    __tablename__ = "woocommerce_outbox"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    order_id = Column(Integer, nullable=False)
+    order_status = Column(String(50), nullable=False)
+    # Event recorded once WooCommerce has accepted the update.
+    event_type = Column(String(50), nullable=False)
+    event_payload = Column(JSON, nullable=True)
+    state = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_woocommerce_outbox_state_next_attempt", "state", "next_attempt_at"),
+    )
+
+class PickerDailyMetrics(Base):
+    """Finished-session counters per picker, warehouse and day of ``finished_at``."""
+    __tablename__ = "picker_daily_metrics"
+    
+    day = Column(Date, primary_key=True)
+    warehouse_id = Column(UUID(as_uuid=True), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    completed_sessions = Column(Integer, nullable=False, default=0)
+    duration_seconds = Column(Float, nullable=False, default=0)
+    items_picked = Column(Integer, nullable=False, default=0)
+    incident_sessions = Column(Integer, nullable=False, default=0)
+
+class ProductDailyMetrics(Base):
+    """Line counters of finished sessions per product EAN, warehouse and day of the session's ``started_at``."""
+    __tablename__ = "product_daily_metrics"
+    
+    day = Column(Date, primary_key=True)
+    warehouse_id = Column(UUID(as_uuid=True), primary_key=True)
+    ean = Column(String(255), primary_key=True)
+    product_name = Column(String(500), nullable=True)
+    total_lines = Column(Integer, nullable=False, default=0)
+    error_lines = Column(Integer, nullable=False, default=0)
+    error_picked = Column(Integer, nullable=False, default=0)
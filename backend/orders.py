@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Order
+from woocommerce import fetch_order, fetch_orders
+
+WOOCOMMERCE_WEBHOOK_SECRET = os.getenv("WOOCOMMERCE_WEBHOOK_SECRET", "")
+ORDER_RECONCILE_INTERVAL_SECONDS = float(os.getenv("ORDER_RECONCILE_INTERVAL_SECONDS", 600))
+# Rows per INSERT; keeps a full reconciliation well under SQLite's and PostgreSQL's bind-parameter limits.
+ORDER_UPSERT_BATCH_SIZE = 500
+
+
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Check ``X-WC-Webhook-Signature``: base64 HMAC-SHA256 of the raw body with the webhook secret."""
+    if not WOOCOMMERCE_WEBHOOK_SECRET or not signature:
+        return False
+    expected = base64.b64encode(
+        hmac.new(WOOCOMMERCE_WEBHOOK_SECRET.encode(), body, hashlib.sha256).digest()
+    ).decode()
+    return hmac.compare_digest(expected, signature)
+
+
+def _modified_at(order: dict) -> Optional[datetime]:
+    value = order.get("date_modified_gmt")
+    return datetime.fromisoformat(value) if value else None
+
+
+def _order_row(order: dict, synced_at: datetime) -> dict:
+    return {
+        "id": order["id"],
+        "number": str(order.get("number", order["id"])),
+        "status": order.get("status", "unknown"),
+        "data": order,
+        "modified_at": _modified_at(order),
+        "synced_at": synced_at
+    }
+
+
+def upsert_orders(db: Session, orders: list):
+    """Insert or refresh local orders; a row never goes back to an older ``date_modified_gmt``."""
+    table = Order.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    now = datetime.utcnow()
+    rows = sorted((_order_row(order, now) for order in orders), key=lambda row: row["id"])
+    for i in range(0, len(rows), ORDER_UPSERT_BATCH_SIZE):
+        stmt = insert(table).values(rows[i:i + ORDER_UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={name: stmt.excluded[name] for name in ("number", "status", "data", "modified_at", "synced_at")},
+            where=or_(
+                table.c.modified_at.is_(None),
+                stmt.excluded.modified_at.is_(None),
+                table.c.modified_at <= stmt.excluded.modified_at
+            )
+        )
+        db.execute(stmt)
+
+
+def delete_orders(db: Session, order_ids):
+    order_ids = [order_id for order_id in order_ids if order_id is not None]
+    if order_ids:
+        db.execute(delete(Order).where(Order.id.in_(order_ids)))
+
+
+class OrderReconciler:
+    """Periodic safety net for missed or out-of-order webhooks.
+
+    Every ``ORDER_RECONCILE_INTERVAL_SECONDS`` (and once at startup, which
+    also fills an empty table) it downloads every processing order, and
+    re-reads the local processing orders that are no longer in that list so
+    their new status, or their deletion, is applied too.
+    """
+
+    def __init__(self, interval: float = ORDER_RECONCILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._session_factory: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _local_processing_ids(self) -> set:
+        with self._session_factory() as db:
+            return {row.id for row in db.query(Order.id).filter(Order.status == "processing").all()}
+
+    def _apply(self, orders: list, deleted_ids: list):
+        with self._session_factory() as db:
+            upsert_orders(db, orders)
+            delete_orders(db, deleted_ids)
+            db.commit()
+
+    async def reconcile(self):
+        orders = await fetch_orders({"status": "processing"})
+        if orders is None:
+            return
+        stale_ids = await asyncio.to_thread(self._local_processing_ids) - {order["id"] for order in orders}
+        deleted_ids = []
+        for order_id in stale_ids:
+            try:
+                order = await fetch_order(order_id, raise_errors=True)
+            except Exception as e:
+                print(f"❌ Error re-reading WooCommerce order {order_id}: {e}")
+                continue
+            if order is None:
+                deleted_ids.append(order_id)
+            else:
+                orders.append(order)
+        await asyncio.to_thread(self._apply, orders, deleted_ids)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"❌ Error reconciling WooCommerce orders: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, session_factory: Callable):
+        self._session_factory = session_factory
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+order_reconciler = OrderReconciler()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models import OutboxJob, SessionModel
+from events import event_writer
+from woocommerce import set_woocommerce_order_status
+
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 5))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 10))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 3600))
+# A claimed job becomes due again after this long, in case its worker died mid-call.
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 120))
+
+
+def enqueue_order_status(db: Session, session: SessionModel, user_id, order_status: str,
+                         event_type: str, event_payload: Optional[dict] = None) -> OutboxJob:
+    """Queue a status write-back in the caller's transaction; ``event_type`` is recorded once it succeeds."""
+    job = OutboxJob(
+        session_id=session.id,
+        user_id=user_id,
+        order_id=session.order_id,
+        order_status=order_status,
+        event_type=event_type,
+        event_payload=event_payload,
+        state="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter for a job that has failed ``attempts`` times."""
+    delay = min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxWorker:
+    """Delivers pending ``woocommerce_outbox`` jobs to WooCommerce.
+
+    Due jobs are claimed by one ``UPDATE ... RETURNING`` that pushes
+    ``next_attempt_at`` one lease ahead and re-checks that the job is still
+    due, so every API worker can run this loop and a job goes to only one of
+    them (``SKIP LOCKED`` only spares PostgreSQL the wait; SQLite ignores it).
+    A success marks the job done and records its event in the same commit; a
+    failure reschedules it with exponential backoff, and after
+    ``OUTBOX_MAX_ATTEMPTS`` it is parked as ``dead`` for an admin to inspect
+    and retry. The outcome is dropped if the lease ran out and another worker
+    claimed the job meanwhile.
+    """
+
+    def __init__(self, poll_interval: float = OUTBOX_POLL_INTERVAL_SECONDS, batch_size: int = OUTBOX_BATCH_SIZE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._session_factory: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _claim(self) -> list:
+        now = datetime.utcnow()
+        due = (
+            select(OutboxJob.id)
+            .where(OutboxJob.state == "pending", OutboxJob.next_attempt_at <= now)
+            .order_by(OutboxJob.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        with self._session_factory() as db:
+            claimed = db.execute(
+                update(OutboxJob)
+                .where(OutboxJob.id.in_(due), OutboxJob.state == "pending", OutboxJob.next_attempt_at <= now)
+                .values(attempts=OutboxJob.attempts + 1, next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+                .returning(OutboxJob.id, OutboxJob.attempts, OutboxJob.order_id, OutboxJob.order_status)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+            return claimed
+
+    def _complete(self, job_id, attempts: int, error: Optional[str]):
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            job = db.get(OutboxJob, job_id)
+            if job is None or job.state != "pending" or job.attempts != attempts:
+                return
+            if error is None:
+                job.state = "done"
+                job.completed_at = now
+                job.last_error = None
+                event_writer.write(db, job.session_id, job.user_id, job.event_type, job.event_payload)
+            elif job.attempts >= self.max_attempts:
+                job.state = "dead"
+                job.last_error = error
+            else:
+                job.next_attempt_at = now + timedelta(seconds=retry_delay(job.attempts))
+                job.last_error = error
+            db.commit()
+
+    async def run_once(self) -> int:
+        jobs = await asyncio.to_thread(self._claim)
+        for job_id, attempts, order_id, order_status in jobs:
+            try:
+                await set_woocommerce_order_status(order_id, order_status)
+                error = None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            await asyncio.to_thread(self._complete, job_id, attempts, error)
+        return len(jobs)
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                print(f"❌ Error processing WooCommerce outbox: {e}")
+                processed = 0
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, session_factory: Callable):
+        self._session_factory = session_factory
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def notify(self):
+        """Process new jobs now instead of at the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+outbox_worker = OutboxWorker()
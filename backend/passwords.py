@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+
+# Hashes with any other cost are flagged by needs_update and re-hashed on login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+
+class PasswordHasher:
+    """Runs bcrypt work in a bounded thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL while hashing, so throughput scales with the
+    number of workers up to the number of cores.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._max_queued = 0
+        self._total_wait_seconds = 0.0
+
+    def _job(self, submitted_at: float, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_wait_seconds += time.monotonic() - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._job, time.monotonic(), fn, args)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "max_queued": self._max_queued,
+                "avg_wait_ms": round(self._total_wait_seconds / self._completed * 1000, 2) if self._completed else 0.0
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS)
+
+
+async def verify_and_update_password(plain_password, hashed_password):
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash uses outdated parameters."""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash(password) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
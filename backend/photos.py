@@ -0,0 +1,348 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from sqlalchemy import update
+
+from cache import TTLCache
+from models import Photo
+
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
+MINIO_BUCKET_NAME = os.getenv("MINIO_BUCKET_NAME")
+# Host handhelds use to reach MinIO directly; presigned requests are signed for it.
+MINIO_PUBLIC_ENDPOINT = os.getenv("MINIO_PUBLIC_ENDPOINT", MINIO_ENDPOINT)
+
+PHOTO_UPLOAD_WORKERS = int(os.getenv("PHOTO_UPLOAD_WORKERS", 4))
+PHOTO_VARIANT_WORKERS = int(os.getenv("PHOTO_VARIANT_WORKERS", 2))
+PHOTO_MULTIPART_THRESHOLD_MB = int(os.getenv("PHOTO_MULTIPART_THRESHOLD_MB", 8))
+PHOTO_MULTIPART_CHUNK_MB = int(os.getenv("PHOTO_MULTIPART_CHUNK_MB", 8))
+PHOTO_THUMBNAIL_SIZE = int(os.getenv("PHOTO_THUMBNAIL_SIZE", 320))
+PHOTO_THUMBNAIL_QUALITY = int(os.getenv("PHOTO_THUMBNAIL_QUALITY", 75))
+PHOTO_WEBP_QUALITY = int(os.getenv("PHOTO_WEBP_QUALITY", 80))
+PHOTO_VARIANT_MAX_ATTEMPTS = int(os.getenv("PHOTO_VARIANT_MAX_ATTEMPTS", 5))
+PHOTO_VARIANT_RETRY_BASE_SECONDS = float(os.getenv("PHOTO_VARIANT_RETRY_BASE_SECONDS", 10))
+PHOTO_MAX_UPLOAD_MB = int(os.getenv("PHOTO_MAX_UPLOAD_MB", 25))
+PHOTO_PRESIGN_EXPIRES_SECONDS = int(os.getenv("PHOTO_PRESIGN_EXPIRES_SECONDS", 900))
+PHOTO_URL_EXPIRES_SECONDS = int(os.getenv("PHOTO_URL_EXPIRES_SECONDS", 3600))
+# Cached download URLs are replaced this long before they expire.
+PHOTO_URL_REFRESH_MARGIN_SECONDS = int(os.getenv("PHOTO_URL_REFRESH_MARGIN_SECONDS", 300))
+
+# Keys are content hashes, so an object never changes once written.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+s3_client = boto3.client(
+    's3',
+    endpoint_url=f'http://{MINIO_ENDPOINT}',
+    aws_access_key_id=MINIO_ACCESS_KEY,
+    aws_secret_access_key=MINIO_SECRET_KEY
+)
+
+# SigV4, so the headers of a presigned PUT (including its checksum) are signed.
+presign_client = boto3.client(
+    's3',
+    endpoint_url=f'http://{MINIO_PUBLIC_ENDPOINT}',
+    aws_access_key_id=MINIO_ACCESS_KEY,
+    aws_secret_access_key=MINIO_SECRET_KEY,
+    config=Config(signature_version="s3v4")
+)
+
+transfer_config = TransferConfig(
+    multipart_threshold=PHOTO_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=PHOTO_MULTIPART_CHUNK_MB * 1024 * 1024,
+    max_concurrency=4
+)
+
+
+signed_url_cache = TTLCache(
+    maxsize=10000,
+    ttl_seconds=max(PHOTO_URL_EXPIRES_SECONDS - PHOTO_URL_REFRESH_MARGIN_SECONDS, 1)
+)
+
+
+class PhotoUploadError(RuntimeError):
+    pass
+
+
+def object_url(key: str) -> str:
+    return f"http://{MINIO_ENDPOINT}/{MINIO_BUCKET_NAME}/{key}"
+
+
+def object_key(url: Optional[str]) -> Optional[str]:
+    """Inverse of ``object_url`` for the URLs stored on photo rows."""
+    prefix = f"http://{MINIO_ENDPOINT}/{MINIO_BUCKET_NAME}/"
+    if not url or not url.startswith(prefix):
+        return None
+    return url[len(prefix):]
+
+
+def signed_urls(keys) -> dict:
+    """Presigned GET URL for each key, reused from the cache until shortly before it expires.
+
+    Reusing the same URL lets browsers keep serving the image from their own
+    cache instead of downloading it again under a new signature.
+    """
+    keys = {key for key in keys if key}
+    urls = signed_url_cache.get_many(keys)
+    missing = {
+        key: presign_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": MINIO_BUCKET_NAME, "Key": key, "ResponseCacheControl": IMMUTABLE_CACHE_CONTROL},
+            ExpiresIn=PHOTO_URL_EXPIRES_SECONDS
+        )
+        for key in keys - urls.keys()
+    }
+    signed_url_cache.set_many(missing)
+    return {**urls, **missing}
+
+
+def photo_key(session_id, digest: str, filename: Optional[str]) -> str:
+    """Content-addressed key: the same bytes always land on the same object, different bytes never collide."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if not re.fullmatch(r"\.\w{1,10}", extension):
+        extension = ".jpg"
+    return f"sessions/{session_id}/{digest}{extension}"
+
+
+def is_photo_key(session_id, key: str) -> bool:
+    return re.fullmatch(rf"sessions/{re.escape(str(session_id))}/[0-9a-f]{{64}}\.[\w]+", key) is not None
+
+
+def key_digest(key: str) -> str:
+    """The SHA-256 a ``photo_key`` was built from."""
+    return os.path.splitext(os.path.basename(key))[0]
+
+
+def checksum_sha256(digest: str) -> str:
+    """A hex SHA-256 in the base64 form of ``x-amz-checksum-sha256``."""
+    return base64.b64encode(bytes.fromhex(digest)).decode()
+
+
+def presign_upload(key: str, content_type: str, size: int) -> dict:
+    """Presigned PUT that lets the client upload ``key`` straight to MinIO.
+
+    The client must send ``headers`` unchanged and a body of exactly ``size``
+    bytes; both are part of the signature. MinIO checks the body against
+    ``x-amz-checksum-sha256`` on write and rejects one that does not hash
+    to the digest in the key.
+    """
+    headers = {
+        "Content-Type": content_type,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "x-amz-checksum-sha256": checksum_sha256(key_digest(key))
+    }
+    url = presign_client.generate_presigned_url(
+        "put_object",
+        Params={
+            "Bucket": MINIO_BUCKET_NAME,
+            "Key": key,
+            "ContentType": content_type,
+            "CacheControl": IMMUTABLE_CACHE_CONTROL,
+            "ContentLength": size,
+            "ChecksumSHA256": headers["x-amz-checksum-sha256"]
+        },
+        ExpiresIn=PHOTO_PRESIGN_EXPIRES_SECONDS
+    )
+    return {"url": url, "headers": headers}
+
+
+def _is_missing(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+def _stat(key: str) -> Optional[dict]:
+    try:
+        return s3_client.head_object(Bucket=MINIO_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if _is_missing(e):
+            return None
+        raise
+
+
+def _hash_object(key: str) -> str:
+    body = s3_client.get_object(Bucket=MINIO_BUCKET_NAME, Key=key)["Body"]
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: body.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify(key: str) -> Optional[bool]:
+    """Whether the stored object matches the SHA-256 in its key (``None`` if missing); a mismatch is deleted.
+
+    Uploads through ``presign_upload`` carry the checksum MinIO verified on
+    write, so ``head_object`` answers without reading the photo. Only
+    objects stored without one are streamed back and hashed here.
+    """
+    try:
+        head = s3_client.head_object(Bucket=MINIO_BUCKET_NAME, Key=key, ChecksumMode="ENABLED")
+    except ClientError as e:
+        if _is_missing(e):
+            return None
+        raise
+    stored_checksum = head.get("ChecksumSHA256")
+    if stored_checksum:
+        matches = stored_checksum == checksum_sha256(key_digest(key))
+    else:
+        matches = _hash_object(key) == key_digest(key)
+    if matches:
+        return True
+    # Keys are content addressed, so a corrupt or partial body must not stay under this one.
+    s3_client.delete_object(Bucket=MINIO_BUCKET_NAME, Key=key)
+    return False
+
+
+def variant_keys(key: str) -> tuple:
+    base = os.path.splitext(key)[0]
+    return f"{base}.thumb.jpg", f"{base}.webp"
+
+
+def _content_hash(fileobj) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def _upload(session_id, fileobj, filename: Optional[str], content_type: Optional[str]) -> str:
+    key = photo_key(session_id, _content_hash(fileobj), filename)
+    extra_args = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+    if content_type:
+        extra_args["ContentType"] = content_type
+    s3_client.upload_fileobj(fileobj, MINIO_BUCKET_NAME, key, ExtraArgs=extra_args, Config=transfer_config)
+    return key
+
+
+def _encode(image, image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _make_variants(key: str) -> tuple:
+    from PIL import Image, ImageOps
+
+    original = s3_client.get_object(Bucket=MINIO_BUCKET_NAME, Key=key)["Body"].read()
+    with Image.open(io.BytesIO(original)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        webp = _encode(image, "WEBP", quality=PHOTO_WEBP_QUALITY, method=4)
+        image.thumbnail((PHOTO_THUMBNAIL_SIZE, PHOTO_THUMBNAIL_SIZE))
+        thumbnail = _encode(image, "JPEG", quality=PHOTO_THUMBNAIL_QUALITY, optimize=True, progressive=True)
+
+    thumbnail_key, webp_key = variant_keys(key)
+    for variant_key, body, content_type in ((thumbnail_key, thumbnail, "image/jpeg"), (webp_key, webp, "image/webp")):
+        s3_client.put_object(
+            Bucket=MINIO_BUCKET_NAME, Key=variant_key, Body=body,
+            ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+    return thumbnail_key, webp_key
+
+
+class PhotoPipeline:
+    """Moves photo I/O off the event loop.
+
+    Uploads stream the request's spooled file to MinIO from a thread pool
+    (multipart above ``PHOTO_MULTIPART_THRESHOLD_MB``). Thumbnails and WebP
+    variants are built afterwards on a separate, smaller pool, so a burst of
+    pallet photos never delays the next upload; the photo row gets the
+    variant URLs once they exist. A failed build is retried with
+    exponential backoff up to ``PHOTO_VARIANT_MAX_ATTEMPTS`` times.
+    """
+
+    def __init__(self, upload_workers: int = PHOTO_UPLOAD_WORKERS, variant_workers: int = PHOTO_VARIANT_WORKERS,
+                 max_attempts: int = PHOTO_VARIANT_MAX_ATTEMPTS,
+                 retry_base_seconds: float = PHOTO_VARIANT_RETRY_BASE_SECONDS):
+        self._uploads = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="photo-upload")
+        self._variants = ThreadPoolExecutor(max_workers=variant_workers, thread_name_prefix="photo-variants")
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self._session_factory: Optional[Callable] = None
+        # Photos with a build queued, running or waiting to be retried.
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+    def start(self, session_factory: Callable):
+        self._session_factory = session_factory
+
+    async def upload(self, session_id, fileobj, filename: Optional[str], content_type: Optional[str]) -> str:
+        """Store the photo and return its object key."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._uploads, _upload, session_id, fileobj, filename, content_type)
+        except Exception as e:
+            raise PhotoUploadError(str(e)) from e
+
+    async def stat(self, key: str) -> Optional[dict]:
+        """``head_object`` metadata of ``key``, or ``None`` when it does not exist."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._uploads, _stat, key)
+        except Exception as e:
+            raise PhotoUploadError(str(e)) from e
+
+    async def verify(self, key: str) -> Optional[bool]:
+        """Check a client upload against the SHA-256 in its key; see ``_verify``."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._uploads, _verify, key)
+        except Exception as e:
+            raise PhotoUploadError(str(e)) from e
+
+    def _process(self, photo_id, key: str, attempt: int):
+        try:
+            thumbnail_key, webp_key = _make_variants(key)
+            with self._session_factory() as db:
+                db.execute(
+                    update(Photo)
+                    .where(Photo.id == photo_id)
+                    .values(thumbnail_url=object_url(thumbnail_key), webp_url=object_url(webp_key))
+                )
+                db.commit()
+        except Exception as e:
+            if attempt < self.max_attempts:
+                delay = self.retry_base_seconds * 2 ** (attempt - 1)
+                print(f"❌ Error creating variants for photo {photo_id} (attempt {attempt}), retrying in {delay:.0f}s: {e}")
+                timer = threading.Timer(delay, self._submit, (photo_id, key, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                return
+            print(f"❌ Giving up on variants for photo {photo_id} after {attempt} attempts: {e}")
+        with self._lock:
+            self._scheduled.discard(photo_id)
+
+    def _submit(self, photo_id, key: str, attempt: int):
+        try:
+            self._variants.submit(self._process, photo_id, key, attempt)
+        except RuntimeError:
+            # Shutting down; the photo is picked up again the next time it is recorded.
+            with self._lock:
+                self._scheduled.discard(photo_id)
+
+    def schedule_variants(self, photo_id, key: str):
+        """Build the variants of ``photo_id`` unless a build for it is already pending."""
+        with self._lock:
+            if photo_id in self._scheduled:
+                return
+            self._scheduled.add(photo_id)
+        self._submit(photo_id, key, 1)
+
+    def shutdown(self):
+        self._uploads.shutdown(wait=False)
+        self._variants.shutdown(wait=True)
+
+
+photo_pipeline = PhotoPipeline()
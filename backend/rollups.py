@@ -0,0 +1,189 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timezone
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import SessionModel, Line, PickerDailyMetrics, ProductDailyMetrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rollup primary keys cannot hold NULL, so sessions without a warehouse use this id.
+NO_WAREHOUSE = uuid.UUID(int=0)
+
+
+def _warehouse_key(warehouse_id):
+    return warehouse_id or NO_WAREHOUSE
+
+
+def _day(value) -> date:
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _seconds_between(started_at: datetime, finished_at: datetime) -> float:
+    if started_at.tzinfo is not None and finished_at.tzinfo is None:
+        finished_at = finished_at.replace(tzinfo=timezone.utc)
+    elif started_at.tzinfo is None and finished_at.tzinfo is not None:
+        started_at = started_at.replace(tzinfo=timezone.utc)
+    return (finished_at - started_at).total_seconds()
+
+
+def duration_seconds(dialect_name: str):
+    """SQL expression for ``finished_at - started_at`` in seconds."""
+    if dialect_name == "sqlite":
+        return (func.julianday(SessionModel.finished_at) - func.julianday(SessionModel.started_at)) * 86400
+    return func.extract("epoch", SessionModel.finished_at - SessionModel.started_at)
+
+
+def _upsert(db: Session, model, rows: list, counters: tuple, replace: tuple = ()):
+    """Add ``counters`` of each row to the existing rollup row, inserting it when missing.
+
+    Columns in ``replace`` take the new row's value when it is not NULL.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    key_columns = [c.name for c in table.primary_key]
+    # A stable order keeps concurrent multi-row upserts from deadlocking.
+    rows = sorted(rows, key=lambda row: tuple(str(row[c]) for c in key_columns))
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in counters},
+            **{name: func.coalesce(stmt.excluded[name], table.c[name]) for name in replace}
+        }
+    )
+    db.execute(stmt)
+
+
+def record_session_finished(db: Session, session: SessionModel, lines):
+    """Add a session that was just marked finished to its picker's and its products' daily counters.
+
+    Counters change once per session rather than on every scan, so pickers
+    working on the same product never queue on its rollup row mid-session.
+    """
+    _upsert(db, PickerDailyMetrics, [{
+        "day": _day(session.finished_at),
+        "warehouse_id": _warehouse_key(session.warehouse_id),
+        "user_id": session.user_id,
+        "completed_sessions": 1,
+        "duration_seconds": _seconds_between(session.started_at, session.finished_at),
+        "items_picked": sum(line.picked_qty or 0 for line in lines),
+        "incident_sessions": 1 if any((line.picked_qty or 0) < line.expected_qty for line in lines) else 0
+    }], ("completed_sessions", "duration_seconds", "items_picked", "incident_sessions"))
+
+    products = defaultdict(lambda: {"total_lines": 0, "error_lines": 0, "error_picked": 0, "product_name": None})
+    for line in lines:
+        product = products[line.ean or ""]
+        product["product_name"] = line.product_name or product["product_name"]
+        product["total_lines"] += 1
+        if (line.picked_qty or 0) != line.expected_qty:
+            product["error_lines"] += 1
+            product["error_picked"] += line.picked_qty or 0
+
+    day = _day(session.started_at)
+    warehouse_id = _warehouse_key(session.warehouse_id)
+    _upsert(db, ProductDailyMetrics, [
+        {"day": day, "warehouse_id": warehouse_id, "ean": ean, **values}
+        for ean, values in products.items()
+    ], ("total_lines", "error_lines", "error_picked"), replace=("product_name",))
+
+
+def rebuild_rollups(db: Session):
+    """Recompute both rollup tables from the raw sessions and lines."""
+    line_totals = (
+        select(
+            Line.session_id,
+            func.sum(Line.picked_qty).label("picked"),
+            func.count(Line.id).filter(Line.picked_qty < Line.expected_qty).label("short_lines")
+        )
+        .group_by(Line.session_id)
+        .subquery()
+    )
+    picker_rows = db.execute(
+        select(
+            func.date(SessionModel.finished_at).label("day"),
+            SessionModel.warehouse_id,
+            SessionModel.user_id,
+            func.count(SessionModel.id).label("completed_sessions"),
+            func.sum(duration_seconds(db.get_bind().dialect.name)).label("duration_seconds"),
+            func.sum(line_totals.c.picked).label("items_picked"),
+            func.count(SessionModel.id).filter(line_totals.c.short_lines > 0).label("incident_sessions")
+        )
+        .select_from(SessionModel)
+        .outerjoin(line_totals, line_totals.c.session_id == SessionModel.id)
+        .where(SessionModel.status == "finished", SessionModel.finished_at.isnot(None))
+        .group_by(func.date(SessionModel.finished_at), SessionModel.warehouse_id, SessionModel.user_id)
+    ).all()
+
+    is_error = func.coalesce(Line.picked_qty, 0) != Line.expected_qty
+    product_rows = db.execute(
+        select(
+            func.date(SessionModel.started_at).label("day"),
+            SessionModel.warehouse_id,
+            func.coalesce(Line.ean, "").label("ean"),
+            func.max(Line.product_name).label("product_name"),
+            func.count(Line.id).label("total_lines"),
+            func.count(Line.id).filter(is_error).label("error_lines"),
+            func.coalesce(func.sum(Line.picked_qty).filter(is_error), 0).label("error_picked")
+        )
+        .select_from(Line)
+        .join(SessionModel, SessionModel.id == Line.session_id)
+        .where(SessionModel.status == "finished")
+        .group_by(func.date(SessionModel.started_at), SessionModel.warehouse_id, func.coalesce(Line.ean, ""))
+    ).all()
+
+    db.execute(delete(PickerDailyMetrics))
+    db.execute(delete(ProductDailyMetrics))
+
+    # Fold the raw groups into rollup keys (a NULL warehouse becomes NO_WAREHOUSE).
+    pickers = defaultdict(lambda: defaultdict(float))
+    for row in picker_rows:
+        key = (_day(row.day), _warehouse_key(row.warehouse_id), row.user_id)
+        for name in ("completed_sessions", "duration_seconds", "items_picked", "incident_sessions"):
+            pickers[key][name] += getattr(row, name) or 0
+    products = defaultdict(lambda: defaultdict(int))
+    for row in product_rows:
+        key = (_day(row.day), _warehouse_key(row.warehouse_id), row.ean)
+        for name in ("total_lines", "error_lines", "error_picked"):
+            products[key][name] += getattr(row, name) or 0
+        products[key]["product_name"] = row.product_name or None
+
+    if pickers:
+        db.execute(PickerDailyMetrics.__table__.insert(), [
+            {
+                "day": day, "warehouse_id": warehouse_id, "user_id": user_id,
+                "completed_sessions": int(values["completed_sessions"]),
+                "duration_seconds": float(values["duration_seconds"]),
+                "items_picked": int(values["items_picked"]),
+                "incident_sessions": int(values["incident_sessions"])
+            }
+            for (day, warehouse_id, user_id), values in pickers.items()
+        ])
+    if products:
+        db.execute(ProductDailyMetrics.__table__.insert(), [
+            {"day": day, "warehouse_id": warehouse_id, "ean": ean, **values}
+            for (day, warehouse_id, ean), values in products.items()
+        ])
+    db.commit()
+    logger.info(f"Rebuilt metrics rollups: {len(pickers)} picker rows, {len(products)} product rows")
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db)
+    finally:
+        db.close()
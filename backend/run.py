@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
+import os
 import uvicorn
-from main import app
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    # Same rule as gunicorn.conf.py: workers only share the cache through Redis.
+    if workers > 1 and os.getenv("CACHE_BACKEND", "local") != "redis":
+        raise RuntimeError(f"WEB_CONCURRENCY={workers} requires CACHE_BACKEND=redis; the local cache is per process")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
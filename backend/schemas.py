@@ -76,9 +76,47 @@ class ScanRequest(BaseModel):
     upc: Optional[str] = None
     sku: Optional[str] = None
 
+class BatchScanItem(BaseModel):
+    code: str
+    idempotency_key: str = Field(min_length=1, max_length=255)
+    client_timestamp: Optional[datetime] = None
+
+class BatchScanRequest(BaseModel):
+    scans: List[BatchScanItem] = Field(min_length=1, max_length=1000)
+
+class BatchScanResult(BaseModel):
+    idempotency_key: str
+    result: str
+    matched_field: Optional[str] = None
+    picked_qty: Optional[int] = None
+    expected_qty: Optional[int] = None
+    product_name: Optional[str] = None
+
+class BatchScanResponse(BaseModel):
+    results: List[BatchScanResult]
+
+class PhotoPresignRequest(BaseModel):
+    sha256: str = Field(pattern=r"^[0-9a-f]{64}$")
+    size: int = Field(gt=0)
+    filename: Optional[str] = None
+    content_type: str = Field(default="image/jpeg", pattern=r"^image/[\w.+-]+$")
+
+class PhotoPresignResponse(BaseModel):
+    key: str
+    url: str
+    headers: Dict[str, str]
+    expires_in: int
+    exists: bool
+
+class PhotoConfirmRequest(BaseModel):
+    key: str
+
 class PhotoResponse(BaseModel):
     id: uuid.UUID
+    session_id: Optional[uuid.UUID] = None
     url: str
+    thumbnail_url: Optional[str] = None
+    webp_url: Optional[str] = None
     created_at: datetime
     
     class Config:
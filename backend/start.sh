@@ -1,2 +1,2 @@
 #!/bin/bash
-uvicorn main:app --host 0.0.0.0 --port 8000
+exec gunicorn -c gunicorn.conf.py main:app
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+# Settings must be in place before the app modules read them at import time.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/picking-test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("WOOCOMMERCE_WEBHOOK_SECRET", "test-webhook-secret")
+os.environ.setdefault("MINIO_ENDPOINT", "minio:9000")
+os.environ.setdefault("MINIO_BUCKET_NAME", "picking-photos")
+os.environ.setdefault("MINIO_ACCESS_KEY", "test")
+os.environ.setdefault("MINIO_SECRET_KEY", "test-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import database
+from models import User, SessionModel, Line
+
+
+@pytest.fixture
+def db():
+    """A session on an empty schema."""
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(username="picker", role="picker", warehouse_id=None):
+        user = User(username=username, password_hash="unused", role=role, warehouse_id=warehouse_id)
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_session(db):
+    """Create a picking session; ``lines`` are ``(ean, expected_qty, picked_qty)`` tuples."""
+    def make(user, lines, order_id=1, status="in_progress", warehouse_id=None, started_at=None, finished_at=None):
+        session = SessionModel(
+            order_id=order_id,
+            user_id=user.id,
+            warehouse_id=warehouse_id,
+            status=status,
+            started_at=started_at,
+            finished_at=finished_at
+        )
+        db.add(session)
+        db.flush()
+        for i, (ean, expected_qty, picked_qty) in enumerate(lines):
+            db.add(Line(
+                session_id=session.id,
+                product_id=i + 1,
+                ean=ean,
+                sku=f"SKU-{ean}",
+                product_name=f"Product {ean}",
+                expected_qty=expected_qty,
+                picked_qty=picked_qty,
+                status="pending"
+            ))
+        db.commit()
+        return session
+    return make
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    asyncio.run(main.user_cache.clear())
+    # No context manager: the startup hook would start the background workers.
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def auth_headers():
+    import main
+
+    def headers(user):
+        return {"Authorization": f"Bearer {main.create_access_token({'sub': user.username})}"}
+    return headers
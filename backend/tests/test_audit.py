@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import database
+from events import event_writer
+from models import Photo
+
+
+def _pages(client, headers, url, limit):
+    cursor = None
+    pages = []
+    # A cursor that does not move past its own page would loop forever.
+    while len(pages) < 20:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get(url, params=params, headers=headers).json()
+        pages.append(body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+    raise AssertionError(f"{url} did not reach the last page")
+
+
+def _ids(pages):
+    return [item["id"] for page in pages for item in page]
+
+
+def test_audit_sessions_are_paged_without_gaps_or_repeats(db, client, auth_headers, make_user, make_session):
+    admin = make_user("admin", "admin")
+    picker = make_user()
+    start = datetime(2026, 10, 1, 8, 0)
+    # Three sessions share a start time, so the id has to break the tie between pages.
+    started = [start, start, start, start + timedelta(minutes=5), start + timedelta(minutes=10)]
+    session_ids = {str(make_session(picker, [("111", 1, 0)], started_at=started_at).id) for started_at in started}
+
+    pages = _pages(client, auth_headers(admin), "/admin/audit/sessions", limit=2)
+    items = [item for page in pages for item in page]
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert {item["id"] for item in items} == session_ids
+    assert len(items) == len(session_ids)
+    assert [item["started_at"] for item in items] == sorted((item["started_at"] for item in items), reverse=True)
+
+
+def test_audit_sessions_reject_a_malformed_cursor(db, client, auth_headers, make_user):
+    admin = make_user("admin", "admin")
+
+    response = client.get("/admin/audit/sessions", params={"cursor": "not-a-cursor"}, headers=auth_headers(admin))
+
+    assert response.status_code == 400
+
+
+def test_audit_sessions_page_over_default_timestamps(db, client, auth_headers, make_user, make_session):
+    admin = make_user("admin", "admin")
+    picker = make_user()
+    session_ids = {str(make_session(picker, [("111", 1, 0)]).id) for _ in range(7)}
+
+    ids = _ids(_pages(client, auth_headers(admin), "/admin/audit/sessions", limit=2))
+
+    assert sorted(ids) == sorted(session_ids)
+
+
+def test_audit_events_page_over_default_timestamps(db, client, auth_headers, make_user, make_session):
+    admin = make_user("admin", "admin")
+    picker = make_user()
+    session = make_session(picker, [("111", 1, 0)])
+    events = [event_writer.write(db, session.id, picker.id, "scan", {"code": "111"}) for _ in range(7)]
+    db.commit()
+
+    ids = _ids(_pages(client, auth_headers(admin), "/admin/audit/events", limit=2))
+
+    assert sorted(ids) == sorted(str(event.id) for event in events)
+
+
+def test_photo_gallery_pages_over_default_timestamps(db, client, auth_headers, make_user, make_session):
+    admin = make_user("admin", "admin")
+    session = make_session(make_user(), [("111", 1, 0)])
+    photos = [Photo(session_id=session.id, url=f"http://minio/sessions/{session.id}/{i}.jpg") for i in range(7)]
+    db.add_all(photos)
+    db.commit()
+
+    ids = _ids(_pages(client, auth_headers(admin), "/photos", limit=2))
+
+    assert sorted(ids) == sorted(str(photo.id) for photo in photos)
+
+
+def test_sqlite_timestamps_without_a_fraction_are_padded(db, client, auth_headers, make_user, make_session):
+    admin = make_user("admin", "admin")
+    picker = make_user()
+    session_ids = {str(make_session(picker, [("111", 1, 0)]).id) for _ in range(5)}
+    # Rows written by CURRENT_TIMESTAMP before the Python-side defaults.
+    db.execute(text("UPDATE sessions SET started_at = '2026-10-01 08:00:00'"))
+    db.commit()
+
+    database._pad_sqlite_timestamps(database.engine)
+
+    ids = _ids(_pages(client, auth_headers(admin), "/admin/audit/sessions", limit=2))
+    assert sorted(ids) == sorted(session_ids)
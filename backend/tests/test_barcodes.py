@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from barcodes import BarcodeIndex, get_session_index, normalize_gtin, remember_session_lines, forget_session
+from models import Line
+
+
+def _line(line_id, ean="", gtin="", upc="", sku=""):
+    return SimpleNamespace(id=line_id, ean=ean, gtin=gtin, upc=upc, sku=sku)
+
+
+def test_normalize_gtin():
+    assert normalize_gtin("12345670") == "00000012345670"
+    assert normalize_gtin(" 036000291452 ") == "00036000291452"
+    assert normalize_gtin("0036000291452") == "00036000291452"
+    assert normalize_gtin("12345") is None
+    assert normalize_gtin("ABC12345") is None
+
+
+def test_match_prefers_fields_in_priority_order():
+    index = BarcodeIndex.from_lines([
+        _line("a", sku="4006381333931"),
+        _line("b", ean="4006381333931"),
+    ])
+
+    assert index.match("4006381333931") == ("b", "ean")
+
+
+def test_match_normalises_gs1_codes_but_not_skus():
+    index = BarcodeIndex.from_lines([
+        _line("a", upc="036000291452"),
+        _line("b", sku="00012345"),
+    ])
+
+    # EAN-13 print of a UPC-A code.
+    assert index.match("0036000291452") == ("a", "upc")
+    assert index.match("00012345") == ("b", "sku")
+    assert index.match("000012345") is None
+
+
+def test_exact_value_wins_over_normalised_one():
+    index = BarcodeIndex.from_lines([
+        _line("a", ean="0036000291452"),
+        _line("b", gtin="036000291452"),
+    ])
+
+    assert index.match("036000291452") == ("b", "gtin")
+    assert index.match("0036000291452") == ("a", "ean")
+
+
+def test_blank_codes_never_match():
+    index = BarcodeIndex.from_lines([_line("a", ean="", sku="")])
+
+    assert index.match("   ") is None
+
+
+def test_session_index_is_rebuilt_from_the_lines(db, make_user, make_session):
+    session = make_session(make_user(), [("8410000000011", 1, 0)])
+    line_id = db.query(Line.id).filter(Line.session_id == session.id).scalar()
+    remember_session_lines(session.id, [])
+    assert get_session_index(db, session.id).match("8410000000011") is None
+
+    forget_session(session.id)
+
+    assert get_session_index(db, session.id).match("8410000000011") == (line_id, "ean")
@@ -0,0 +1,32 @@
+import asyncio
+
+from models import Line
+
+
+def test_retried_scan_is_replayed_not_applied_again(db, client, auth_headers, make_user, make_session):
+    picker = make_user()
+    session = make_session(picker, [("8410000000011", 2, 0)])
+    headers = dict(auth_headers(picker), **{"Idempotency-Key": "scan-1"})
+
+    first = client.post(f"/sessions/{session.id}/scan", json={"code": "8410000000011"}, headers=headers)
+    retry = client.post(f"/sessions/{session.id}/scan", json={"code": "8410000000011"}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert db.query(Line.picked_qty).filter(Line.session_id == session.id).scalar() == 1
+
+
+def test_invalidated_user_is_reloaded(db, client, auth_headers, make_user):
+    import main
+
+    picker = make_user()
+    assert client.get("/admin/audit/events", headers=auth_headers(picker)).status_code == 403
+    picker.role = "supervisor"
+    db.commit()
+    # Still the cached picker until the entry is dropped.
+    assert client.get("/admin/audit/events", headers=auth_headers(picker)).status_code == 403
+
+    asyncio.run(main.invalidate_cached_user(picker.username))
+
+    assert client.get("/admin/audit/events", headers=auth_headers(picker)).status_code == 200
@@ -0,0 +1,96 @@
+import uuid
+from datetime import date
+
+from metrics import compute_metrics
+from models import PickerDailyMetrics, ProductDailyMetrics
+
+WAREHOUSE_A = uuid.uuid4()
+WAREHOUSE_B = uuid.uuid4()
+
+
+def _picker_row(user, day, warehouse_id, sessions, seconds, items, incidents):
+    return PickerDailyMetrics(
+        day=day, warehouse_id=warehouse_id, user_id=user.id, completed_sessions=sessions,
+        duration_seconds=seconds, items_picked=items, incident_sessions=incidents
+    )
+
+
+def _product_row(day, warehouse_id, ean, total_lines, error_lines, error_picked):
+    return ProductDailyMetrics(
+        day=day, warehouse_id=warehouse_id, ean=ean, product_name=f"Product {ean}",
+        total_lines=total_lines, error_lines=error_lines, error_picked=error_picked
+    )
+
+
+def _seed(db, make_user, make_session):
+    ana = make_user("ana")
+    luis = make_user("luis")
+    make_session(ana, [("A", 1, 0)], warehouse_id=WAREHOUSE_A)
+    db.add_all([
+        _picker_row(ana, date(2026, 10, 1), WAREHOUSE_A, 2, 1200, 10, 1),
+        _picker_row(ana, date(2026, 10, 2), WAREHOUSE_B, 1, 300, 4, 0),
+        _picker_row(luis, date(2026, 10, 2), WAREHOUSE_A, 3, 1800, 9, 0),
+        _product_row(date(2026, 10, 1), WAREHOUSE_A, "A", 4, 1, 0),
+        _product_row(date(2026, 10, 2), WAREHOUSE_A, "A", 4, 1, 2),
+        _product_row(date(2026, 10, 2), WAREHOUSE_B, "B", 5, 3, 1),
+        _product_row(date(2026, 10, 2), WAREHOUSE_A, "C", 2, 0, 0),
+    ])
+    db.commit()
+
+
+def test_compute_metrics_sums_rollups(db, make_user, make_session):
+    _seed(db, make_user, make_session)
+
+    metrics = compute_metrics(db)
+
+    assert metrics.total_completed_orders == 6
+    assert metrics.total_active_sessions == 1
+    assert metrics.avg_picking_time_minutes == round(3300 / 6 / 60, 2)
+    assert metrics.incidents_count == 1
+    pickers = {p.picker_username: p for p in metrics.picker_metrics}
+    assert pickers["ana"].completed_orders == 3
+    assert pickers["ana"].total_items_picked == 14
+    assert pickers["ana"].avg_picking_time_minutes == round(1500 / 3 / 60, 2)
+    assert pickers["luis"].avg_picking_time_minutes == 10.0
+    assert [(p.ean, p.error_count, p.total_picked, p.error_rate) for p in metrics.top_error_products] == [
+        ("B", 3, 1, 60.0),
+        ("A", 2, 2, 25.0),
+    ]
+
+
+def test_compute_metrics_filters_days_and_warehouse(db, make_user, make_session):
+    _seed(db, make_user, make_session)
+
+    metrics = compute_metrics(db, day_from=date(2026, 10, 2), day_to=date(2026, 10, 2), warehouse_id=WAREHOUSE_A)
+
+    assert metrics.total_completed_orders == 3
+    assert [p.picker_username for p in metrics.picker_metrics] == ["luis"]
+    assert [p.ean for p in metrics.top_error_products] == ["A"]
+    assert metrics.top_error_products[0].error_count == 1
+
+
+def test_compute_metrics_empty(db):
+    metrics = compute_metrics(db)
+
+    assert metrics.total_completed_orders == 0
+    assert metrics.avg_picking_time_minutes == 0.0
+    assert metrics.picker_metrics == []
+    assert metrics.top_error_products == []
+
+
+def test_metrics_endpoint_serves_snapshot_with_etag(db, client, auth_headers, make_user, make_session):
+    _seed(db, make_user, make_session)
+    supervisor = make_user("sara", role="supervisor")
+
+    response = client.get("/metrics", headers=auth_headers(supervisor))
+
+    assert response.status_code == 200
+    assert response.json()["total_completed_orders"] == 6
+    cached = client.get("/metrics", headers={**auth_headers(supervisor), "If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def test_metrics_endpoint_requires_supervisor(client, auth_headers, make_user):
+    picker = make_user()
+
+    assert client.get("/metrics", headers=auth_headers(picker)).status_code == 403
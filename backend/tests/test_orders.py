@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import hmac
+import json
+import sqlite3
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+import orders
+from models import Order
+from orders import upsert_orders, verify_webhook_signature
+
+
+def _sign(body: bytes, secret: str = orders.WOOCOMMERCE_WEBHOOK_SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def _order(order_id, status="processing", modified="2026-10-01T10:00:00"):
+    return {"id": order_id, "number": str(order_id), "status": status, "date_modified_gmt": modified}
+
+
+def _webhook(client, topic, payload, signature=None):
+    body = json.dumps(payload).encode()
+    return client.post("/webhooks/woocommerce", content=body, headers={
+        "X-WC-Webhook-Topic": topic,
+        "X-WC-Webhook-Signature": signature if signature is not None else _sign(body)
+    })
+
+
+def test_verify_webhook_signature():
+    body = b'{"id": 1}'
+
+    assert verify_webhook_signature(body, _sign(body))
+    assert not verify_webhook_signature(body, _sign(body, "another-secret"))
+    assert not verify_webhook_signature(body + b" ", _sign(body))
+    assert not verify_webhook_signature(body, None)
+
+
+def test_verify_webhook_signature_without_secret(monkeypatch):
+    body = b'{"id": 1}'
+    monkeypatch.setattr(orders, "WOOCOMMERCE_WEBHOOK_SECRET", "")
+
+    assert not verify_webhook_signature(body, _sign(body, ""))
+
+
+def test_webhook_rejects_bad_signature(db, client):
+    response = _webhook(client, "order.created", _order(1), signature=_sign(b"something else"))
+
+    assert response.status_code == 401
+    assert db.query(Order).count() == 0
+
+
+def test_webhook_upserts_and_deletes_orders(db, client):
+    assert _webhook(client, "order.created", _order(1)).status_code == 200
+    assert _webhook(client, "order.updated", _order(1, "completed", "2026-10-01T11:00:00")).status_code == 200
+    # A late delivery of an older version does not roll the order back.
+    assert _webhook(client, "order.updated", _order(1, "on-hold", "2026-10-01T10:30:00")).status_code == 200
+
+    assert db.query(Order.status).filter(Order.id == 1).scalar() == "completed"
+
+    assert _webhook(client, "order.deleted", {"id": 1}).status_code == 200
+    db.expire_all()
+    assert db.query(Order).count() == 0
+
+
+def test_upsert_orders_beyond_the_bind_parameter_limit():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def default_variable_limit(dbapi_connection, connection_record):
+        # Stock SQLite builds allow 32766 bind parameters per statement; some distributions raise it.
+        dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 32766)
+
+    Order.__table__.create(engine)
+    with Session(engine) as db:
+        # 6000 orders x 6 columns would not fit in one statement.
+        upsert_orders(db, [_order(order_id) for order_id in range(1, 6001)])
+        db.commit()
+
+        assert db.query(Order).count() == 6000
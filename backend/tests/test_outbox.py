@@ -0,0 +1,90 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import outbox
+from database import get_db
+from models import Event, OutboxJob
+from outbox import OutboxWorker, enqueue_order_status
+
+
+def _worker(**kwargs) -> OutboxWorker:
+    worker = OutboxWorker(**kwargs)
+    # start() would also launch the polling task; these tests drive the worker directly.
+    worker._session_factory = contextmanager(get_db)
+    return worker
+
+
+def _job(db, make_user, make_session) -> OutboxJob:
+    picker = make_user()
+    session = make_session(picker, [("111", 1, 1)], order_id=42)
+    job = enqueue_order_status(db, session, picker.id, "completed", "finish", {"order_status": "completed"})
+    db.commit()
+    return job
+
+
+def test_a_due_job_is_claimed_once(db, make_user, make_session):
+    job = _job(db, make_user, make_session)
+
+    first = _worker()._claim()
+    second = _worker()._claim()
+
+    assert [(row.id, row.attempts, row.order_id) for row in first] == [(job.id, 1, 42)]
+    assert second == []
+
+
+def test_an_expired_lease_is_reclaimed_and_the_stale_outcome_dropped(db, make_user, make_session):
+    job = _job(db, make_user, make_session)
+    stale = _worker()
+    stale_claim = stale._claim()[0]
+    db.query(OutboxJob).update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    fresh_claim = _worker()._claim()[0]
+    stale._complete(stale_claim.id, stale_claim.attempts, None)
+
+    db.refresh(job)
+    assert fresh_claim.attempts == 2
+    assert job.state == "pending"
+    assert db.query(Event).count() == 0
+
+
+def test_delivery_records_the_event(db, make_user, make_session, monkeypatch):
+    job = _job(db, make_user, make_session)
+    delivered = []
+
+    async def set_status(order_id, status):
+        delivered.append((order_id, status))
+
+    monkeypatch.setattr(outbox, "set_woocommerce_order_status", set_status)
+
+    assert asyncio.run(_worker().run_once()) == 1
+
+    db.refresh(job)
+    assert delivered == [(42, "completed")]
+    assert job.state == "done"
+    assert [(event.type, event.payload) for event in db.query(Event).all()] == [
+        ("finish", {"order_status": "completed"})
+    ]
+
+
+def test_failures_back_off_then_park_the_job(db, make_user, make_session, monkeypatch):
+    job = _job(db, make_user, make_session)
+
+    async def set_status(order_id, status):
+        raise RuntimeError("503 Service Unavailable")
+
+    monkeypatch.setattr(outbox, "set_woocommerce_order_status", set_status)
+    worker = _worker(max_attempts=2)
+
+    asyncio.run(worker.run_once())
+    db.refresh(job)
+    assert (job.state, job.attempts, job.last_error) == ("pending", 1, "503 Service Unavailable")
+    assert job.next_attempt_at > datetime.utcnow()
+
+    job.next_attempt_at = datetime.utcnow()
+    db.commit()
+    asyncio.run(worker.run_once())
+    db.refresh(job)
+    assert (job.state, job.attempts) == ("dead", 2)
+    assert db.query(Event).count() == 0
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import io
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+import photos
+from database import get_db
+from models import Photo
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _photo(db, make_user, make_session):
+    session = make_session(make_user(), [("111", 1, 0)])
+    photo = Photo(session_id=session.id, url=photos.object_url(f"sessions/{session.id}/a.jpg"))
+    db.add(photo)
+    db.commit()
+    return photo
+
+
+def test_variants_are_retried_until_they_succeed(db, make_user, make_session, monkeypatch):
+    photo = _photo(db, make_user, make_session)
+    calls = []
+
+    def flaky_variants(key):
+        calls.append(key)
+        if len(calls) < 3:
+            raise OSError("MinIO unavailable")
+        return photos.variant_keys(key)
+
+    monkeypatch.setattr(photos, "_make_variants", flaky_variants)
+    pipeline = photos.PhotoPipeline(upload_workers=1, variant_workers=1, max_attempts=3, retry_base_seconds=0.01)
+    pipeline.start(contextmanager(get_db))
+
+    pipeline.schedule_variants(photo.id, "sessions/s/a.jpg")
+
+    assert _wait_for(lambda: not pipeline._scheduled)
+    pipeline.shutdown()
+    db.refresh(photo)
+    assert len(calls) == 3
+    assert photo.thumbnail_url == photos.object_url("sessions/s/a.thumb.jpg")
+    assert photo.webp_url == photos.object_url("sessions/s/a.webp")
+
+
+def test_variants_give_up_after_max_attempts(db, make_user, make_session, monkeypatch):
+    photo = _photo(db, make_user, make_session)
+    calls = []
+
+    def broken_variants(key):
+        calls.append(key)
+        raise OSError("cannot identify image file")
+
+    monkeypatch.setattr(photos, "_make_variants", broken_variants)
+    pipeline = photos.PhotoPipeline(upload_workers=1, variant_workers=1, max_attempts=2, retry_base_seconds=0.01)
+    pipeline.start(contextmanager(get_db))
+
+    pipeline.schedule_variants(photo.id, "sessions/s/a.jpg")
+
+    assert _wait_for(lambda: not pipeline._scheduled)
+    pipeline.shutdown()
+    db.refresh(photo)
+    assert len(calls) == 2
+    assert photo.thumbnail_url is None
+
+
+class FakeS3:
+    def __init__(self, objects, checksums=None):
+        self.objects = objects
+        self.checksums = checksums or {}
+        self.reads = []
+
+    def _missing(self, operation):
+        from botocore.exceptions import ClientError
+
+        return ClientError({"Error": {"Code": "NoSuchKey"}}, operation)
+
+    def head_object(self, Bucket, Key, ChecksumMode=None):
+        if Key not in self.objects:
+            raise self._missing("HeadObject")
+        head = {"ContentLength": len(self.objects[Key])}
+        if ChecksumMode == "ENABLED" and Key in self.checksums:
+            head["ChecksumSHA256"] = self.checksums[Key]
+        return head
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self._missing("GetObject")
+        self.reads.append(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+def _confirm(client, headers, session_id, key):
+    return client.post(f"/sessions/{session_id}/photo/confirm", json={"key": key}, headers=headers)
+
+
+def test_confirm_checks_the_stored_bytes(db, client, auth_headers, make_user, make_session, monkeypatch):
+    import main
+
+    picker = make_user()
+    session = make_session(picker, [("111", 1, 0)])
+    body = b"\xff\xd8 pallet photo"
+    key = photos.photo_key(session.id, hashlib.sha256(body).hexdigest(), "pallet.jpg")
+    partial_key = photos.photo_key(session.id, hashlib.sha256(body + b"rest").hexdigest(), "pallet.jpg")
+    s3 = FakeS3({key: body, partial_key: body})
+    monkeypatch.setattr(photos, "s3_client", s3)
+    monkeypatch.setattr(main.photo_pipeline, "schedule_variants", lambda photo_id, file_key: None)
+
+    mismatch = _confirm(client, auth_headers(picker), session.id, partial_key)
+    missing = _confirm(client, auth_headers(picker), session.id, partial_key)
+    confirmed = _confirm(client, auth_headers(picker), session.id, key)
+
+    assert mismatch.status_code == 422
+    assert partial_key not in s3.objects
+    assert missing.status_code == 400
+    assert confirmed.status_code == 200
+    assert db.query(Photo).filter(Photo.session_id == session.id).count() == 1
+
+
+def test_confirm_trusts_the_checksum_stored_on_write(db, client, auth_headers, make_user, make_session, monkeypatch):
+    import main
+
+    picker = make_user()
+    session = make_session(picker, [("111", 1, 0)])
+    digest = hashlib.sha256(b"\xff\xd8 pallet photo").hexdigest()
+    key = photos.photo_key(session.id, digest, "pallet.jpg")
+    s3 = FakeS3({key: b"\xff\xd8 pallet photo"}, {key: photos.checksum_sha256(digest)})
+    monkeypatch.setattr(photos, "s3_client", s3)
+    monkeypatch.setattr(main.photo_pipeline, "schedule_variants", lambda photo_id, file_key: None)
+
+    response = _confirm(client, auth_headers(picker), session.id, key)
+
+    assert response.status_code == 200
+    assert s3.reads == []
+
+
+def test_presign_signs_checksum_and_size():
+    digest = hashlib.sha256(b"photo").hexdigest()
+
+    upload = photos.presign_upload(f"sessions/s/{digest}.jpg", "image/jpeg", size=1234)
+
+    assert upload["headers"]["x-amz-checksum-sha256"] == base64.b64encode(hashlib.sha256(b"photo").digest()).decode()
+    signed = parse_qs(urlparse(upload["url"]).query)["X-Amz-SignedHeaders"][0].split(";")
+    assert {"content-length", "content-type", "cache-control", "x-amz-checksum-sha256"} <= set(signed)
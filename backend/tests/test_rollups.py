@@ -0,0 +1,123 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import String, cast, select
+
+import database
+from main import apply_scan, close_session
+from models import Exception, Line, OutboxJob, Photo, PickerDailyMetrics, ProductDailyMetrics
+from rollups import record_session_finished, rebuild_rollups
+
+WAREHOUSE = uuid.uuid4()
+
+
+def _rows(db, model, columns) -> list:
+    # warehouse_id is read as text: SQLite stores the all-zero NO_WAREHOUSE key as the number 0.
+    rows = db.execute(
+        select(cast(model.warehouse_id, String), *(getattr(model, name) for name in columns))
+    ).all()
+    return sorted(tuple(round(v, 3) if isinstance(v, float) else v for v in row) for row in rows)
+
+
+def _rollup_rows(db) -> dict:
+    return {
+        "pickers": _rows(db, PickerDailyMetrics, (
+            "day", "user_id", "completed_sessions", "duration_seconds", "items_picked", "incident_sessions"
+        )),
+        "products": _rows(db, ProductDailyMetrics, (
+            "day", "ean", "product_name", "total_lines", "error_lines", "error_picked"
+        ))
+    }
+
+
+def _scan(db, session, user, code, times=1):
+    for _ in range(times):
+        apply_scan(db, session, user, code)
+        db.commit()
+
+
+def _finish(db, session, finished_at):
+    session.status = "finished"
+    session.finished_at = finished_at
+    record_session_finished(db, session, db.query(Line).filter(Line.session_id == session.id).all())
+    db.commit()
+
+
+def test_rebuild_matches_incremental_rollups(db, make_user, make_session):
+    ana = make_user("ana", warehouse_id=WAREHOUSE)
+    luis = make_user("luis")
+
+    complete = make_session(ana, [("111", 2, 0), ("222", 1, 0)], order_id=1,
+                      warehouse_id=WAREHOUSE, started_at=datetime(2026, 10, 1, 9, 0))
+    _scan(db, complete, ana, "111", times=3)
+    _scan(db, complete, ana, "222")
+    _finish(db, complete, datetime(2026, 10, 1, 9, 12, 30))
+
+    short = make_session(ana, [("111", 3, 0), ("333", 2, 0)], order_id=2,
+                   warehouse_id=WAREHOUSE, started_at=datetime(2026, 10, 1, 23, 50))
+    _scan(db, short, ana, "111")
+    _scan(db, short, ana, "999")
+    _finish(db, short, datetime(2026, 10, 2, 0, 5))
+
+    open_session = make_session(luis, [("222", 4, 0)], order_id=3,
+                          started_at=datetime(2026, 10, 2, 8, 0))
+    _scan(db, open_session, luis, "222", times=2)
+
+    incremental = _rollup_rows(db)
+    rebuild_rollups(db)
+
+    assert _rollup_rows(db) == incremental
+    assert len(incremental["pickers"]) == 2
+    # The open session is not counted until it finishes.
+    assert [row[2:] for row in incremental["products"]] == [
+        ("111", "Product 111", 2, 1, 1),
+        ("222", "Product 222", 1, 0, 0),
+        ("333", "Product 333", 1, 1, 0),
+    ]
+
+
+def test_scans_leave_rollups_untouched(db, make_user, make_session):
+    ana = make_user("ana")
+    session = make_session(ana, [("111", 2, 0)])
+
+    _scan(db, session, ana, "111", times=2)
+
+    assert _rollup_rows(db) == {"pickers": [], "products": []}
+
+
+def test_rebuild_on_empty_database(db):
+    rebuild_rollups(db)
+
+    assert _rollup_rows(db) == {"pickers": [], "products": []}
+
+
+def test_only_one_concurrent_close_gets_the_session(db, make_user, make_session):
+    session = make_session(make_user(), [("111", 1, 1)])
+    first, second = database.SessionLocal(), database.SessionLocal()
+    try:
+        # Both requests loaded the session while it was still in progress.
+        assert close_session(first, session.id) is not None
+        first.commit()
+        assert close_session(second, session.id) is None
+        second.commit()
+    finally:
+        first.close()
+        second.close()
+
+
+def test_finish_then_exception_approval_counts_the_session_once(db, client, auth_headers, make_user, make_session):
+    picker = make_user()
+    supervisor = make_user("supervisor", "supervisor")
+    session = make_session(picker, [("111", 1, 1)])
+    exception = Exception(session_id=session.id, picker_id=picker.id, reason="label torn")
+    db.add_all([Photo(session_id=session.id, url="http://minio/a.jpg"), exception])
+    db.commit()
+
+    finished = client.post(f"/sessions/{session.id}/finish", json={}, headers=auth_headers(picker))
+    approved = client.post(
+        f"/exceptions/{exception.id}/approve", json={"approved": True}, headers=auth_headers(supervisor)
+    )
+
+    assert (finished.status_code, approved.status_code) == (200, 200)
+    assert [row[2] for row in _rows(db, PickerDailyMetrics, ("user_id", "completed_sessions"))] == [1]
+    assert db.query(OutboxJob).filter(OutboxJob.session_id == session.id).count() == 1
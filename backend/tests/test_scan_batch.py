@@ -0,0 +1,71 @@
+import uuid
+
+from models import Event, Line
+
+
+def _batch(client, headers, session_id, scans):
+    return client.post(
+        f"/sessions/{session_id}/scans:batch",
+        json={"scans": [{"code": code, "idempotency_key": key} for code, key in scans]},
+        headers=headers
+    )
+
+
+def test_batch_applies_scans_in_order(db, client, auth_headers, make_user, make_session):
+    picker = make_user()
+    session = make_session(picker, [("8410000000011", 2, 0)])
+
+    response = _batch(client, auth_headers(picker), session.id, [
+        ("8410000000011", "k1"), ("8410000000011", "k2"), ("8410000000011", "k3"), ("0000", "k4")
+    ])
+
+    assert response.status_code == 200
+    assert [r["result"] for r in response.json()["results"]] == ["valid", "valid", "complete", "invalid"]
+    assert db.query(Line.picked_qty).filter(Line.session_id == session.id).scalar() == 2
+
+
+def test_batch_replay_reports_every_outcome_as_duplicate(db, client, auth_headers, make_user, make_session):
+    picker = make_user()
+    session = make_session(picker, [("8410000000011", 1, 0)])
+    scans = [("8410000000011", "k1"), ("8410000000011", "k2"), ("0000", "k3")]
+
+    first = _batch(client, auth_headers(picker), session.id, scans).json()["results"]
+    replay = _batch(client, auth_headers(picker), session.id, scans).json()["results"]
+
+    assert [r["result"] for r in first] == ["valid", "complete", "invalid"]
+    assert [r["result"] for r in replay] == ["duplicate"] * 3
+    assert [r["picked_qty"] for r in replay[:2]] == [1, 1]
+    assert db.query(Line.picked_qty).filter(Line.session_id == session.id).scalar() == 1
+    keys = db.query(Event.idempotency_key).filter(Event.session_id == session.id).all()
+    assert sorted(key for key, in keys) == ["k1", "k2", "k3"]
+
+
+def test_batch_rejects_malformed_session_id(client, auth_headers, make_user):
+    picker = make_user()
+
+    response = _batch(client, auth_headers(picker), "not-a-uuid", [("8410000000011", "k1")])
+
+    assert response.status_code == 422
+
+
+def test_batch_unknown_session(client, auth_headers, make_user):
+    picker = make_user()
+
+    response = _batch(client, auth_headers(picker), uuid.uuid4(), [("8410000000011", "k1")])
+
+    assert response.status_code == 404
+
+
+def test_batch_accepts_codes_longer_than_the_indexed_column(db, client, auth_headers, make_user, make_session):
+    picker = make_user()
+    session = make_session(picker, [("8410000000011", 1, 0)])
+    code = "https://picking.example/labels/" + "x" * 300
+
+    response = _batch(client, auth_headers(picker), session.id, [(code, "k1")])
+
+    assert response.json()["results"][0]["result"] == "invalid"
+    event = db.query(Event).filter(Event.session_id == session.id).one()
+    assert event.payload["code"] == code
+    assert event.code == code[:255]
+    history = client.get("/admin/audit/events", params={"code": code}, headers=auth_headers(make_user("admin", "admin")))
+    assert [item["id"] for item in history.json()["items"]] == [str(event.id)]
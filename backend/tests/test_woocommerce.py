@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+import woocommerce
+from woocommerce import OrderCache
+
+
+def _fetches(monkeypatch) -> list:
+    fetched = []
+
+    async def fetch_order(order_id, raise_errors=False):
+        fetched.append(order_id)
+        return {"id": order_id}
+
+    monkeypatch.setattr(woocommerce, "fetch_order", fetch_order)
+    return fetched
+
+
+def test_order_cache_evicts_beyond_maxsize(monkeypatch):
+    fetched = _fetches(monkeypatch)
+    cache = OrderCache(ttl_seconds=60, maxsize=2)
+
+    async def run():
+        for order_id in (1, 2, 1, 3, 1, 2):
+            await cache.get(order_id)
+
+    asyncio.run(run())
+
+    # 2 was the least recently used entry when 3 came in.
+    assert fetched == [1, 2, 3, 2]
+    assert len(cache._orders) == 2
+
+
+def test_order_cache_refetches_after_invalidation(monkeypatch):
+    fetched = _fetches(monkeypatch)
+    cache = OrderCache(ttl_seconds=60)
+
+    async def run():
+        await cache.get(1)
+        await cache.get(1)
+        await cache.invalidate(1)
+        await cache.get(1)
+
+    asyncio.run(run())
+
+    assert fetched == [1, 1]
+
+
+def _store(monkeypatch, retry_after) -> list:
+    requests = []
+
+    def handle(request):
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(429, headers={"Retry-After": retry_after})
+        return httpx.Response(200, json={"id": 1})
+
+    monkeypatch.setattr(woocommerce, "_client", httpx.AsyncClient(
+        base_url="http://store/wp-json/wc/v3/", transport=httpx.MockTransport(handle)
+    ))
+    return requests
+
+
+def test_short_retry_after_is_waited_out(monkeypatch):
+    requests = _store(monkeypatch, "0")
+
+    response = asyncio.run(woocommerce._request("GET", "orders/1"))
+
+    assert (response.status_code, len(requests)) == (200, 2)
+
+
+def test_long_retry_after_is_not_waited_for(monkeypatch):
+    requests = _store(monkeypatch, "3600")
+
+    response = asyncio.run(asyncio.wait_for(woocommerce._request("GET", "orders/1"), timeout=5))
+
+    assert (response.status_code, len(requests)) == (429, 1)
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from cache import TTLCache, shared_cache
+
+load_dotenv()
+
+WOOCOMMERCE_URL = os.getenv("WOOCOMMERCE_URL")
+WOOCOMMERCE_CONSUMER_KEY = os.getenv("WOOCOMMERCE_CONSUMER_KEY")
+WOOCOMMERCE_CONSUMER_SECRET = os.getenv("WOOCOMMERCE_CONSUMER_SECRET")
+
+ORDER_CACHE_TTL_SECONDS = int(os.getenv("ORDER_CACHE_TTL_SECONDS", 30))
+ORDER_CACHE_MAX_SIZE = int(os.getenv("ORDER_CACHE_MAX_SIZE", 1000))
+PRODUCT_CACHE_TTL_SECONDS = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", 3600))
+PRODUCT_CACHE_MAX_SIZE = int(os.getenv("PRODUCT_CACHE_MAX_SIZE", 5000))
+WOOCOMMERCE_PAGE_SIZE = 100
+
+WOOCOMMERCE_TIMEOUT_SECONDS = float(os.getenv("WOOCOMMERCE_TIMEOUT_SECONDS", 10))
+WOOCOMMERCE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("WOOCOMMERCE_CONNECT_TIMEOUT_SECONDS", 3))
+WOOCOMMERCE_MAX_CONNECTIONS = int(os.getenv("WOOCOMMERCE_MAX_CONNECTIONS", 20))
+WOOCOMMERCE_MAX_CONCURRENCY = int(os.getenv("WOOCOMMERCE_MAX_CONCURRENCY", 10))
+WOOCOMMERCE_MAX_RETRIES = int(os.getenv("WOOCOMMERCE_MAX_RETRIES", 3))
+WOOCOMMERCE_RETRY_BACKOFF_SECONDS = float(os.getenv("WOOCOMMERCE_RETRY_BACKOFF_SECONDS", 0.5))
+# Longest Retry-After worth waiting for inside a request; longer ones are returned as is.
+WOOCOMMERCE_MAX_RETRY_AFTER_SECONDS = float(os.getenv("WOOCOMMERCE_MAX_RETRY_AFTER_SECONDS", WOOCOMMERCE_TIMEOUT_SECONDS))
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore = asyncio.Semaphore(WOOCOMMERCE_MAX_CONCURRENCY)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared WooCommerce client, creating its connection pool on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=f"{WOOCOMMERCE_URL}/wp-json/wc/v3/",
+            auth=httpx.BasicAuth(WOOCOMMERCE_CONSUMER_KEY or "", WOOCOMMERCE_CONSUMER_SECRET or ""),
+            timeout=httpx.Timeout(WOOCOMMERCE_TIMEOUT_SECONDS, connect=WOOCOMMERCE_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=WOOCOMMERCE_MAX_CONNECTIONS,
+                max_keepalive_connections=WOOCOMMERCE_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+async def close_woocommerce_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+    """Seconds to wait before the next attempt, or ``None`` if the store asks for too long a pause."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = float(retry_after)
+        return delay if delay <= WOOCOMMERCE_MAX_RETRY_AFTER_SECONDS else None
+    return WOOCOMMERCE_RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+async def _request(method: str, path: str, **kwargs) -> httpx.Response:
+    """Send a WooCommerce request, retrying connection errors and 429/5xx with backoff."""
+    client = get_client()
+    for attempt in range(WOOCOMMERCE_MAX_RETRIES + 1):
+        response = None
+        try:
+            async with _semaphore:
+                response = await client.request(method, path, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == WOOCOMMERCE_MAX_RETRIES:
+                return response
+        except httpx.TransportError:
+            if attempt == WOOCOMMERCE_MAX_RETRIES:
+                raise
+        delay = _retry_delay(attempt, response)
+        if delay is None:
+            return response
+        await asyncio.sleep(delay)
+
+
+class OrderCache:
+    """In-process cache of WooCommerce orders keyed by order id, filled from ``/orders/{id}`` on a miss.
+
+    The order list is served from the local ``orders`` table (see ``orders``);
+    this cache only backs the single-order lookups that still go to the store.
+    """
+
+    def __init__(self, ttl_seconds: int, maxsize: int = ORDER_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        # When each order was last invalidated, shared so a status change made
+        # by one worker also expires the copies cached by the others.
+        self._invalidated_at = shared_cache("order_invalidations", maxsize=4096, ttl_seconds=ttl_seconds)
+        # (order, fetched_at) pairs; expired and least recently used ones are evicted.
+        self._orders = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    async def _cached(self, order_id: int) -> Optional[dict]:
+        entry = self._orders.get(order_id)
+        if entry is None:
+            return None
+        order, fetched_at = entry
+        if await self._invalidated_at.get(order_id, 0.0) >= fetched_at:
+            self._orders.delete(order_id)
+            return None
+        return order
+
+    async def get(self, order_id: int) -> Optional[dict]:
+        order = await self._cached(order_id)
+        if order is not None:
+            return order
+
+        order = await fetch_order(order_id)
+        if order is None:
+            return None
+        self._orders.set(order_id, (order, time.time()))
+        return order
+
+    async def invalidate(self, order_id: int):
+        self._orders.delete(order_id)
+        await self._invalidated_at.set(order_id, time.time())
+
+
+async def fetch_order(order_id: int, raise_errors: bool = False) -> Optional[dict]:
+    """The order, or ``None`` if it does not exist (or on any error unless ``raise_errors``)."""
+    try:
+        response = await _request("GET", f"orders/{order_id}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error fetching WooCommerce order {order_id}: {e}")
+        return None
+
+
+async def fetch_orders(params: dict) -> Optional[list]:
+    orders = []
+    page = 1
+    try:
+        while True:
+            response = await _request(
+                "GET",
+                "orders",
+                params={**params, "per_page": WOOCOMMERCE_PAGE_SIZE, "page": page}
+            )
+            response.raise_for_status()
+            batch = response.json()
+            orders.extend(batch)
+            if len(batch) < WOOCOMMERCE_PAGE_SIZE:
+                return orders
+            page += 1
+    except Exception as e:
+        print(f"Error fetching WooCommerce orders: {e}")
+        return None
+
+
+order_cache = OrderCache(ORDER_CACHE_TTL_SECONDS, ORDER_CACHE_MAX_SIZE)
+
+
+async def get_woocommerce_order(order_id: int) -> Optional[dict]:
+    return await order_cache.get(order_id)
+
+
+async def invalidate_woocommerce_order(order_id: int):
+    await order_cache.invalidate(order_id)
+
+
+EAN_META_KEYS = ("ean", "_ean", "_alg_ean", "_wpm_gtin_code")
+GTIN_META_KEYS = ("gtin", "_gtin", "_global_unique_id")
+UPC_META_KEYS = ("upc", "_upc")
+
+
+def _meta_value(meta: dict, keys) -> str:
+    for key in keys:
+        value = meta.get(key)
+        if value:
+            return str(value).strip()
+    return ""
+
+
+def _product_details(product: dict) -> dict:
+    meta = {m.get("key"): m.get("value") for m in product.get("meta_data") or []}
+
+    image_url = None
+    if product.get('images') and len(product['images']) > 0:
+        image_url = product['images'][0].get('src')
+
+    return {
+        'id': product.get('id'),
+        'name': product.get('name'),
+        'sku': product.get('sku'),
+        'ean': _meta_value(meta, EAN_META_KEYS),
+        'gtin': product.get('global_unique_id') or _meta_value(meta, GTIN_META_KEYS),
+        'upc': _meta_value(meta, UPC_META_KEYS),
+        'image_url': image_url
+    }
+
+
+async def fetch_products(product_ids: list) -> dict:
+    """Fetch products with one ``include=`` request per page of ids."""
+    products = {}
+    for i in range(0, len(product_ids), WOOCOMMERCE_PAGE_SIZE):
+        chunk = product_ids[i:i + WOOCOMMERCE_PAGE_SIZE]
+        try:
+            response = await _request(
+                "GET",
+                "products",
+                params={"include": ",".join(str(p) for p in chunk), "per_page": len(chunk)}
+            )
+            response.raise_for_status()
+            for product in response.json():
+                products[product["id"]] = _product_details(product)
+        except Exception as e:
+            print(f"Error fetching WooCommerce products {chunk}: {e}")
+            return products
+        for product_id in chunk:
+            products.setdefault(product_id, None)
+    return products
+
+
+product_cache = TTLCache(maxsize=PRODUCT_CACHE_MAX_SIZE, ttl_seconds=PRODUCT_CACHE_TTL_SECONDS)
+
+
+async def get_woocommerce_products(product_ids) -> dict:
+    """Return product details by id, fetching all cache misses in one batch.
+
+    Products WooCommerce does not return are cached as ``None`` so a deleted
+    product does not trigger a request on every lookup.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    products = product_cache.get_many(product_ids)
+    missing = [p for p in product_ids if p not in products]
+    if missing:
+        fetched = await fetch_products(missing)
+        product_cache.set_many(fetched)
+        products.update(fetched)
+    return products
+
+
+async def set_woocommerce_order_status(order_id: int, status: str):
+    """Set the order's status; raises on failure so the outbox can retry."""
+    response = await _request("PUT", f"orders/{order_id}", json={"status": status})
+    response.raise_for_status()
+    await order_cache.invalidate(order_id)
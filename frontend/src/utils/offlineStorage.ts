@@ -62,6 +62,9 @@ export class OfflineDatabase extends Dexie {
 
 export const offlineDB = new OfflineDatabase()
 
+// Queued POST /sessions/{id}/scan calls are replayed through the batch endpoint
+const SCAN_CALL_PATTERN = /^(.*\/sessions\/[^/]+)\/scan$/
+
 export class OfflineStorageManager {
   private static instance: OfflineStorageManager
   private isOnline: boolean = navigator.onLine
@@ -167,9 +170,18 @@ export class OfflineStorageManager {
     console.log('Starting offline data sync...')
 
     try {
-      const pendingCalls = await offlineDB.pendingCalls.toArray()
+      const pendingCalls = await offlineDB.pendingCalls.orderBy('timestamp').toArray()
+      const scanBatches = new Map<string, PendingApiCall[]>()
       
       for (const call of pendingCalls) {
+        const scanMatch = call.method === 'POST' ? SCAN_CALL_PATTERN.exec(call.url) : null
+        if (scanMatch) {
+          const batch = scanBatches.get(scanMatch[1]) || []
+          batch.push(call)
+          scanBatches.set(scanMatch[1], batch)
+          continue
+        }
+
         try {
           const response = await fetch(call.url, {
             method: call.method,
@@ -181,22 +193,35 @@ export class OfflineStorageManager {
             await offlineDB.pendingCalls.delete(call.id)
             console.log(`Synced API call: ${call.method} ${call.url}`)
           } else {
-            call.retries++
-            if (call.retries >= 3) {
-              console.error(`Failed to sync after 3 retries: ${call.method} ${call.url}`)
-              await offlineDB.pendingCalls.delete(call.id)
-            } else {
-              await offlineDB.pendingCalls.put(call)
-            }
+            await this.retryLater([call])
           }
         } catch (error) {
-          call.retries++
-          if (call.retries >= 3) {
-            console.error(`Failed to sync after 3 retries: ${call.method} ${call.url}`, error)
-            await offlineDB.pendingCalls.delete(call.id)
+          await this.retryLater([call], error)
+        }
+      }
+
+      for (const [sessionUrl, calls] of scanBatches) {
+        try {
+          const response = await fetch(`${sessionUrl}/scans:batch`, {
+            method: 'POST',
+            headers: calls[0].headers,
+            body: JSON.stringify({
+              scans: calls.map(call => ({
+                code: call.data?.code,
+                idempotency_key: call.id,
+                client_timestamp: call.timestamp
+              }))
+            })
+          })
+
+          if (response.ok) {
+            await offlineDB.pendingCalls.bulkDelete(calls.map(call => call.id))
+            console.log(`Synced ${calls.length} scans: ${sessionUrl}`)
           } else {
-            await offlineDB.pendingCalls.put(call)
+            await this.retryLater(calls)
           }
+        } catch (error) {
+          await this.retryLater(calls, error)
         }
       }
 
@@ -209,6 +234,18 @@ export class OfflineStorageManager {
     }
   }
 
+  private async retryLater(calls: PendingApiCall[], error?: unknown): Promise<void> {
+    for (const call of calls) {
+      call.retries++
+      if (call.retries >= 3) {
+        console.error(`Failed to sync after 3 retries: ${call.method} ${call.url}`, error ?? '')
+        await offlineDB.pendingCalls.delete(call.id)
+      } else {
+        await offlineDB.pendingCalls.put(call)
+      }
+    }
+  }
+
   private async markDataAsSynced(): Promise<void> {
     await offlineDB.orders.where('synced').equals(0).modify({ synced: 1 })
     await offlineDB.sessions.where('synced').equals(0).modify({ synced: 1 })